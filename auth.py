@@ -0,0 +1,15 @@
+from telegram.ext.filters import UpdateFilter
+
+import database
+
+
+class _Owner(UpdateFilter):
+    """Passes only updates from an owner. Reads the in-memory owner set, no DB hit."""
+
+    def filter(self, update):
+        user = update.effective_user
+        return bool(user and database.is_owner(user.username))
+
+
+# Attach to owner-only handlers so non-owner traffic is dropped at dispatch
+OWNER = _Owner(name="auth.OWNER")
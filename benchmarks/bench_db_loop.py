@@ -0,0 +1,92 @@
+"""
+Event-loop latency under concurrent /start load: blocking DB calls vs database.aio.
+
+Each simulated /start does what the handler does against the DB (add_user,
+owner check, claim link lookup) while a probe coroutine measures how late the
+loop wakes it up. Run from the repo root:
+
+    python benchmarks/bench_db_loop.py --users 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import database  # noqa: E402
+
+
+async def probe(lags, stop, interval=0.005):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t - interval)
+
+
+async def fake_start_sync(user_id):
+    database.add_user(user_id, f"user{user_id}", None)
+    database.is_owner(f"user{user_id}")
+    database.get_setting('claim_link')
+    await asyncio.sleep(0)  # the reply_text round trip would yield here
+
+
+async def fake_start_async(user_id):
+    await database.aio.add_user(user_id, f"user{user_id}", None)
+    database.is_owner(f"user{user_id}")
+    database.get_setting('claim_link')
+    await asyncio.sleep(0)
+
+
+async def run_mode(handler, first_id, users, concurrency):
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(uid):
+        async with sem:
+            await handler(uid)
+
+    t = time.perf_counter()
+    await asyncio.gather(*(one(first_id + i) for i in range(users)))
+    elapsed = time.perf_counter() - t
+    stop.set()
+    await probe_task
+
+    lags.sort()
+    return {
+        'starts_per_s': users / elapsed,
+        'lag_p50_ms': statistics.median(lags) * 1000,
+        'lag_p99_ms': lags[int(len(lags) * 0.99) - 1] * 1000,
+        'lag_max_ms': lags[-1] * 1000,
+        'samples': len(lags),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.db.init(os.path.join(tmp, 'bench.db'))
+        database.init_db()
+
+        for name, handler, first_id in (
+            ('sync (before)', fake_start_sync, 1_000_000),
+            ('database.aio (after)', fake_start_async, 2_000_000),
+        ):
+            r = asyncio.run(run_mode(handler, first_id, args.users, args.concurrency))
+            print(f"{name:22} {r['starts_per_s']:8.0f} starts/s  loop lag "
+                  f"p50 {r['lag_p50_ms']:6.2f} ms  p99 {r['lag_p99_ms']:7.2f} ms  "
+                  f"max {r['lag_max_ms']:7.2f} ms  ({r['samples']} samples)")
+
+        database.db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Concurrent reads and writes on the User table under different SQLite profiles.
+
+Reader threads run get_user() on random ids while writer threads credit points,
+as the bot's DB thread does, for a fixed duration. Every profile runs against a
+fresh database with the same seed data. Run from the repo root:
+
+    python benchmarks/bench_sqlite.py --rows 20000 --readers 4 --writers 1 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peewee import OperationalError  # noqa: E402
+
+import database  # noqa: E402
+from database import User  # noqa: E402
+
+PROFILES = {
+    'default (rollback journal, synchronous=FULL)': {
+        'journal_mode': 'delete', 'synchronous': 'full', 'busy_timeout': 5000,
+    },
+    'wal only': {
+        'journal_mode': 'wal', 'synchronous': 'full', 'busy_timeout': 5000,
+    },
+    'bot profile (database.storage_pragmas)': database.storage_pragmas(),
+}
+
+
+def seed(rows):
+    with database.db.atomic():
+        for start in range(0, rows, 500):
+            User.insert_many(
+                [{'user_id': i, 'username': f'u{i}'} for i in range(start, min(rows, start + 500))]
+            ).execute()
+
+
+def reader(rows, deadline, counts, errors):
+    database.db.connect(reuse_if_open=True)
+    n = 0
+    while time.perf_counter() < deadline:
+        try:
+            database.get_user(random.randrange(rows))
+            n += 1
+        except OperationalError:
+            errors.append('read')
+    database.db.close()
+    counts.append(n)
+
+
+def writer(rows, deadline, counts, errors):
+    database.db.connect(reuse_if_open=True)
+    n = 0
+    while time.perf_counter() < deadline:
+        try:
+            with database.db.atomic():
+                database.add_points(random.randrange(rows), 1)
+            n += 1
+        except OperationalError:
+            errors.append('write')
+    database.db.close()
+    counts.append(n)
+
+
+def run_profile(pragmas, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.db.init(os.path.join(tmp, 'bench.db'), pragmas=pragmas)
+        database.init_db()
+        seed(args.rows)
+        database.db.close()
+
+        reads, writes, errors = [], [], []
+        deadline = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=reader, args=(args.rows, deadline, reads, errors))
+                   for _ in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(args.rows, deadline, writes, errors))
+                    for _ in range(args.writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return sum(reads) / args.seconds, sum(writes) / args.seconds, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for name, pragmas in PROFILES.items():
+        reads, writes, errors = run_profile(pragmas, args)
+        print(f"{name:45} {reads:10.0f} reads/s {writes:8.0f} writes/s {errors:5d} busy errors")
+
+
+if __name__ == '__main__':
+    main()
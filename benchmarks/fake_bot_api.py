@@ -0,0 +1,267 @@
+"""
+Local stand-in for the Telegram Bot API, for benchmarks and offline runs.
+
+Implements getMe, getUpdates, sendMessage, copyMessage, sendMediaGroup,
+getChat, getChatMember and the small calls handlers make along the way, with
+configurable latency plus random error and 429 (flood control) injection.
+FakeRequest serves the same fake in-process, without HTTP. Point the bot at
+the server with BOT_API_BASE_URL:
+
+    python benchmarks/fake_bot_api.py --port 8081 --latency 0.05 --flood-rate 0.01
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot BOT_TOKEN=123456:FAKE python bot.py
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from telegram.request import BaseRequest  # noqa: E402
+
+import web  # noqa: E402
+
+TOKEN = '123456:FAKE'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+# Calls that never get latency or injected errors: bot bootstrap and polling
+UNTHROTTLED = {'getMe', 'getUpdates', 'deleteWebhook', 'setWebhook', 'getWebhookInfo'}
+
+ADMIN_RIGHTS = dict(
+    can_be_edited=False, is_anonymous=False, can_manage_chat=True, can_delete_messages=True,
+    can_manage_video_chats=True, can_restrict_members=True, can_promote_members=False,
+    can_change_info=True, can_invite_users=True, can_post_messages=True,
+)
+
+
+def _params(request):
+    # PTB sends form fields whose non-string values are JSON encoded
+    ctype = request.headers.get('content-type', '')
+    if 'json' in ctype:
+        return json.loads(request.body or b'{}')
+    params = {}
+    for key, values in urllib.parse.parse_qs(request.body.decode(), keep_blank_values=True).items():
+        try:
+            params[key] = json.loads(values[-1])
+        except ValueError:
+            params[key] = values[-1]
+    return params
+
+
+class FakeBotAPI:
+    def __init__(self, token=TOKEN, latency=0.0, jitter=0.0, error_rate=0.0, flood_rate=0.0,
+                 retry_after=1, member_status='member', seed=None):
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.member_status = member_status
+        self.members = {}  # (chat_id, user_id) -> status, overrides member_status
+        self.calls = collections.Counter()
+        self.errors = collections.Counter()
+        self.sent = []  # (wall time, method, chat_id)
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1000)
+        self._update_ids = itertools.count(1)
+        self._updates = []
+        self._new_update = asyncio.Event()
+        self._server = web.WebServer()
+        self.port = None
+        for method in self.METHODS:
+            handler = self._handler(method)
+            self._server.route('POST', f'/bot{token}/{method}', handler)
+            self._server.route('GET', f'/bot{token}/{method}', handler)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    async def start(self, port=0, host='127.0.0.1'):
+        await self._server.start(host, port)
+        self.port = self._server._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self._server.stop()
+
+    def push_update(self, update):
+        update = dict(update, update_id=next(self._update_ids))
+        self._updates.append(update)
+        self._new_update.set()
+        return update
+
+    def reset_stats(self):
+        self.calls.clear()
+        self.errors.clear()
+        self.sent.clear()
+
+    # --- request plumbing ---
+
+    async def call(self, method, params):
+        """Run one API method in-process and return (HTTP status, response dict)."""
+        impl = getattr(self, '_' + method, None)
+        if method not in self.METHODS or impl is None:
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        self.calls[method] += 1
+        if method not in UNTHROTTLED:
+            if self.latency or self.jitter:
+                await asyncio.sleep(self.latency + self._random.random() * self.jitter)
+            roll = self._random.random()
+            if roll < self.flood_rate:
+                self.errors['429'] += 1
+                return self._error(429, f'Too Many Requests: retry after {self.retry_after}',
+                                   {'retry_after': self.retry_after})
+            if roll < self.flood_rate + self.error_rate:
+                self.errors['400'] += 1
+                return self._error(400, 'Bad Request: chat not found')
+        return 200, {'ok': True, 'result': await impl(params)}
+
+    def _handler(self, method):
+        async def handle(request):
+            status, body = await self.call(method, _params(request))
+            return web.Response(json.dumps(body), status=status, content_type='application/json')
+
+        return handle
+
+    @staticmethod
+    def _error(code, description, parameters=None):
+        body = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            body['parameters'] = parameters
+        return code, body
+
+    def _chat(self, chat_id):
+        chat_id = int(chat_id) if str(chat_id).lstrip('-').isdigit() else -1000000000000 - abs(hash(chat_id)) % 10**9
+        if chat_id < 0:
+            return {'id': chat_id, 'type': 'channel', 'title': f'Channel {chat_id}'}
+        return {'id': chat_id, 'type': 'private', 'first_name': f'User {chat_id}'}
+
+    def _message(self, chat_id, **extra):
+        return dict({'message_id': next(self._message_ids), 'date': int(time.time()),
+                     'chat': self._chat(chat_id), 'from': BOT_USER}, **extra)
+
+    # --- Bot API methods ---
+
+    METHODS = ('getMe', 'getUpdates', 'deleteWebhook', 'setWebhook', 'getWebhookInfo', 'sendMessage',
+               'copyMessage', 'sendMediaGroup', 'editMessageText', 'answerCallbackQuery', 'getChat',
+               'getChatMember', 'close', 'logOut')
+
+    async def _getMe(self, params):
+        return BOT_USER
+
+    async def _getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return self._updates[:limit]
+
+    async def _deleteWebhook(self, params):
+        return True
+
+    async def _setWebhook(self, params):
+        return True
+
+    async def _getWebhookInfo(self, params):
+        return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+
+    async def _close(self, params):
+        return True
+
+    async def _logOut(self, params):
+        return True
+
+    async def _sendMessage(self, params):
+        self.sent.append((time.time(), 'sendMessage', params['chat_id']))
+        return self._message(params['chat_id'], text=str(params.get('text', '')))
+
+    async def _copyMessage(self, params):
+        self.sent.append((time.time(), 'copyMessage', params['chat_id']))
+        return {'message_id': next(self._message_ids)}
+
+    async def _sendMediaGroup(self, params):
+        self.sent.append((time.time(), 'sendMediaGroup', params['chat_id']))
+        return [self._message(params['chat_id']) for _ in params.get('media', [])]
+
+    async def _editMessageText(self, params):
+        return self._message(params.get('chat_id') or 1, text=str(params.get('text', '')))
+
+    async def _answerCallbackQuery(self, params):
+        return True
+
+    async def _getChat(self, params):
+        return self._chat(params['chat_id'])
+
+    async def _getChatMember(self, params):
+        user_id = int(params['user_id'])
+        user = {'id': user_id, 'is_bot': user_id == BOT_USER['id'], 'first_name': f'User {user_id}'}
+        status = self.members.get((str(params['chat_id']), user_id))
+        if status is None and user_id == BOT_USER['id']:
+            return dict({'status': 'administrator', 'user': user}, **ADMIN_RIGHTS)
+        return {'status': status or self.member_status, 'user': user}
+
+
+class FakeRequest(BaseRequest):
+    """
+    PTB request backend that answers from a FakeBotAPI without any sockets,
+    for replay and profiling: ApplicationBuilder().request(FakeRequest(api)).
+    """
+
+    def __init__(self, api):
+        self.api = api
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        params = request_data.parameters if request_data else {}
+        status, body = await self.api.call(url.rsplit('/', 1)[-1], params)
+        return status, json.dumps(body).encode()
+
+
+async def _serve(args):
+    api = FakeBotAPI(token=args.token, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     flood_rate=args.flood_rate, retry_after=args.retry_after, member_status=args.member_status)
+    await api.start(args.port, args.host)
+    print(f"Fake Bot API on {api.base_url} (token {args.token})")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--token', default=TOKEN)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every API call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls failing with 400')
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='share of calls answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--member-status', default='member', help='getChatMember status for users')
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
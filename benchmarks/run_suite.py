@@ -0,0 +1,224 @@
+"""
+End-to-end benchmark suite against the local fake Bot API.
+
+Runs the real Application, handlers and a throwaway SQLite database against
+benchmarks/fake_bot_api.py and measures:
+
+    start        /start throughput under concurrent users
+    verify_join  "Verify Joined" latency vs channel count
+    broadcast    broadcast wall time vs channel count
+    schedule     scheduled-post fire lag
+
+Results are printed and, with --out, written as JSON so runs can be diffed:
+
+    python benchmarks/run_suite.py --latency 0.05 --out bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DB_PATH'] = os.path.join(_tmp.name, 'bench.db')
+os.environ.setdefault('SCHEDULE_STAGGER_SECONDS', '0')
+
+from telegram import Update  # noqa: E402
+
+import bot  # noqa: E402
+import config  # noqa: E402
+import database  # noqa: E402
+import membership  # noqa: E402
+import outbox  # noqa: E402
+import scheduler  # noqa: E402
+import transport  # noqa: E402
+from fake_bot_api import FakeBotAPI, TOKEN  # noqa: E402
+
+
+def _user(uid):
+    return {'id': uid, 'is_bot': False, 'first_name': f'U{uid}', 'username': f'user{uid}'}
+
+
+def start_update(uid):
+    chat = {'id': uid, 'type': 'private', 'first_name': f'U{uid}'}
+    return {'update_id': uid, 'message': {
+        'message_id': 1, 'date': int(time.time()), 'chat': chat, 'from': _user(uid), 'text': '/start',
+        'entities': [{'offset': 0, 'length': 6, 'type': 'bot_command'}]}}
+
+
+def callback_update(uid, data):
+    chat = {'id': uid, 'type': 'private', 'first_name': f'U{uid}'}
+    return {'update_id': uid, 'callback_query': {
+        'id': str(uid), 'chat_instance': '1', 'data': data, 'from': _user(uid),
+        'message': {'message_id': 2, 'date': int(time.time()), 'chat': chat, 'text': 'x'}}}
+
+
+def percentile(samples, q):
+    # Nearest-rank on already sorted samples
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+async def set_channels(count):
+    def replace():
+        database.Channel.delete().execute()
+        database.load_channels()
+        for i in range(count):
+            database.add_channel_safe(-1001000000000 - i, f'Bench {i}', None, f'https://t.me/bench{i}')
+    await database.run(replace)
+
+
+async def process(app, data):
+    await app.process_update(Update.de_json(data, app.bot))
+
+
+async def bench_start(app, users, concurrency, first_uid):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(uid):
+        async with sem:
+            t = time.perf_counter()
+            await process(app, start_update(uid))
+            latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    await asyncio.gather(*(one(first_uid + i) for i in range(users)))
+    elapsed = time.perf_counter() - t
+    return dict(summarize(latencies), users=users, concurrency=concurrency, per_second=users / elapsed)
+
+
+async def bench_verify(app, channel_counts, repeats, first_uid):
+    results = []
+    uid = first_uid
+    for count in channel_counts:
+        await set_channels(count)
+        latencies = []
+        for _ in range(repeats):
+            uid += 1
+            await database.aio.add_user(uid, f'user{uid}')
+            membership._joined.clear()
+            t = time.perf_counter()
+            await process(app, callback_update(uid, 'verify_join'))
+            latencies.append(time.perf_counter() - t)
+        results.append(dict(summarize(latencies), channels=count))
+    return results
+
+
+async def bench_broadcast(app, api, channel_counts):
+    results = []
+    for count in channel_counts:
+        await set_channels(count)
+        api.reset_stats()
+        t = time.perf_counter()
+        counts = await outbox.submit(app.bot, {'type': 'text', 'text': 'bench'})
+        elapsed = time.perf_counter() - t
+        results.append({'channels': count, 'seconds': elapsed, 'sent': counts.get('sent', 0),
+                        'failed': counts.get('failed', 0), 'per_second': count / elapsed,
+                        'api_errors': dict(api.errors)})
+    return results
+
+
+async def bench_schedule(app, api, samples):
+    # Lag is due time -> first post reaching the API, so it includes one round trip
+    await set_channels(1)
+    post = await database.aio.add_schedule('00:00', {'type': 'text', 'text': 'scheduled'})
+    schedule = scheduler.dispatcher.add(post)
+    lags = []
+    for _ in range(samples):
+        api.reset_stats()
+        due = time.time() + 0.3
+        scheduler.dispatcher._push_at(schedule, due)
+        scheduler.dispatcher._wakeup.set()
+        while not api.sent:
+            await asyncio.sleep(0.005)
+        lags.append(api.sent[0][0] - due)
+        # Let the channel's per-chat bucket refill so it doesn't count as lag
+        await asyncio.sleep(1.0 / config.BROADCAST_PER_CHAT_RATE)
+    scheduler.dispatcher.remove(post.id)
+    return summarize(lags)
+
+
+async def run(args):
+    api = await FakeBotAPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           flood_rate=args.flood_rate, seed=1).start()
+    config.BOT_API_BASE_URL = api.base_url
+    database.init_db()
+    app = bot.build_application(TOKEN)
+    await app.initialize()
+    await transport.bulk_bot.initialize()
+    await app.start()
+    await scheduler.dispatcher.start(app)
+
+    results = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'latency_s': args.latency, 'jitter_s': args.jitter, 'error_rate': args.error_rate,
+            'flood_rate': args.flood_rate, 'broadcast_rate': config.BROADCAST_GLOBAL_RATE,
+            'broadcast_concurrency': config.BROADCAST_CONCURRENCY,
+        },
+    }
+    try:
+        await set_channels(args.start_channels)
+        results['start'] = await bench_start(app, args.users, args.concurrency, 10_000)
+        print(f"start: {results['start']['per_second']:.0f}/s, p95 {results['start']['p95_ms']:.0f} ms")
+
+        results['verify_join'] = await bench_verify(app, args.verify_channels, args.repeats, 1_000_000)
+        for r in results['verify_join']:
+            print(f"verify_join {r['channels']:4d} channels: p50 {r['p50_ms']:.0f} ms, p95 {r['p95_ms']:.0f} ms")
+
+        results['broadcast'] = await bench_broadcast(app, api, args.broadcast_channels)
+        for r in results['broadcast']:
+            print(f"broadcast {r['channels']:4d} channels: {r['seconds']:.2f} s ({r['per_second']:.1f}/s)")
+
+        results['schedule'] = await bench_schedule(app, api, args.repeats)
+        print(f"schedule fire lag: p50 {results['schedule']['p50_ms']:.0f} ms, "
+              f"max {results['schedule']['max_ms']:.0f} ms")
+    finally:
+        await scheduler.dispatcher.stop()
+        await app.stop()
+        await app.shutdown()
+        await transport.bulk_bot.shutdown()
+        await api.stop()
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--start-channels', type=int, default=20)
+    parser.add_argument('--verify-channels', type=int, nargs='+', default=[1, 10, 40, 100])
+    parser.add_argument('--broadcast-channels', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--out', help='write JSON results here')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,28 @@ import logging
 import sys
 import asyncio
 import platform
+import secrets
+import signal
+import time
 
 # Fix for Windows asyncio SSL issues
 if platform.system() == 'Windows':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from telegram.ext import ApplicationBuilder
-from telegram.request import HTTPXRequest
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
 import config
 import database
+import metrics
+import ordering
+import outbox
+import recorder
+import refresher
+import scheduler
+import throttle
+import transport
+import web
 from handlers import owner, channel, broadcast, user
-from keep_alive import keep_alive
 
 # Logging setup
 logging.basicConfig(
@@ -20,29 +31,119 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-def main():
-    if not config.BOT_TOKEN:
-        print("Error: BOT_TOKEN not found in config or env.")
-        return
+HEARTBEAT_INTERVAL = 10
 
-    # Init DB
-    database.init_db()
-    
-    # Build Application
-    request = HTTPXRequest(connect_timeout=60.0, read_timeout=60.0, write_timeout=60.0, pool_timeout=60.0)
-    application = ApplicationBuilder().token(config.BOT_TOKEN).request(request).build()
+# Health check, /metrics and (in webhook mode) updates, on the bot's own loop
+server = web.WebServer()
+
+async def metrics_endpoint(request):
+    return web.Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+server.route('GET', '/', web.health)
+server.route('GET', '/metrics', metrics_endpoint)
+
+# Optional log of raw incoming updates, for tools/replay.py
+update_log = recorder.UpdateRecorder(config.RECORD_UPDATES_PATH) if config.RECORD_UPDATES_PATH else None
+
+async def flush_points_job(context):
+    await database.aio.flush_points()
+
+async def heartbeat_job(context):
+    # JobQueue lag: how late this repeating job fires compared to its interval
+    now = time.monotonic()
+    last = context.job.data.get('last')
+    if last is not None:
+        metrics.JOBQUEUE_LAG.observe(max(0.0, now - last - HEARTBEAT_INTERVAL))
+    context.job.data['last'] = now
+
+async def post_init(application):
+    metrics.UPDATE_QUEUE_DEPTH.set_function(application.pending_updates)
+    metrics.UPDATES_WAITING_ON_USER.set_function(application.waiting_updates)
+    if transport.bulk_bot:
+        await transport.bulk_bot.initialize()
+    await server.start('0.0.0.0', config.PORT)
+    # Finish broadcasts a restart interrupted, without blocking startup
+    application.create_task(outbox.resume(application.bot))
+    await scheduler.dispatcher.start(application)
+
+async def post_shutdown(application):
+    await scheduler.dispatcher.stop()
+    await server.stop()
+    if transport.bulk_bot:
+        await transport.bulk_bot.shutdown()
+    # Don't lose write-behind point credits on a clean stop
+    await database.aio.flush_points()
+    if update_log:
+        update_log.close()
+
+async def wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    await stop.wait()
+
+async def run_webhook(application):
+    # Updates arrive on the same HTTP server as the health check and metrics
+    secret = config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    server.route('POST', config.WEBHOOK_PATH, web.webhook_handler(application, secret))
+
+    async with application:
+        await post_init(application)
+        await application.start()
+        await application.bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=config.ALLOWED_UPDATES,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+        print(f"Webhook mode: listening on port {config.PORT}")
+        try:
+            await wait_for_stop_signal()
+        finally:
+            await application.stop()
+    await post_shutdown(application)
+
+def build_application(token=None, request=None):
+    """Build the Application with every handler and job registered. Doesn't start it."""
+    token = token or config.BOT_TOKEN
+    if request is None:
+        # Separate pools so a broadcast can't starve replies or polling (see transport.py)
+        builder = ApplicationBuilder().token(token).request(transport.interactive_request())
+        builder = builder.get_updates_request(transport.poll_request())
+        transport.bulk_bot = transport.make_bulk_bot(token)
+    else:
+        # A custom backend (e.g. the replay tool's fake) serves every call
+        builder = ApplicationBuilder().token(token).request(request)
+        transport.bulk_bot = None
+    # Parallel across users, in order per user (see ordering.py)
+    builder = builder.application_class(ordering.OrderedApplication).concurrent_updates(config.CONCURRENT_UPDATES)
+    if config.BOT_API_BASE_URL:
+        # e.g. a local Bot API server or benchmarks/fake_bot_api.py
+        builder = builder.base_url(config.BOT_API_BASE_URL)
+    application = builder.post_init(post_init).post_shutdown(post_shutdown).build()
+
+    if update_log:
+        # Before every other group, so even updates a handler rejects are logged
+        application.add_handler(TypeHandler(Update, update_log.record), group=-1000)
     
+    # Per-user rate limits run before every handler below (see throttle.py)
+    application.add_handler(TypeHandler(Update, throttle.check), group=-1)
+
     # Register User Handlers (Start, Join, Verify) - High Priority
     for h in user.get_handlers():
-        application.add_handler(h)
+        application.add_handler(metrics.instrument(h))
 
     # Register Owner Handlers
     for h in owner.get_handlers():
-        application.add_handler(h)
+        application.add_handler(metrics.instrument(h))
         
     # Register Channel Handlers
     for h in channel.get_handlers():
-        application.add_handler(h)
+        application.add_handler(metrics.instrument(h))
         
     # Register Broadcast/Schedule Handlers
     # Note: broadcast_message is in get_handlers() of broadcast module
@@ -51,16 +152,36 @@ def main():
     # owner/channel handlers are Commands.
     # broadcast has Commands AND MessageHandler.
     for h in broadcast.get_handlers():
-        application.add_handler(h)
+        application.add_handler(metrics.instrument(h))
+
+    # Scheduled posts are loaded by scheduler.dispatcher in post_init
+    application.job_queue.run_repeating(heartbeat_job, interval=HEARTBEAT_INTERVAL, data={})
+    if config.POINTS_WRITE_BEHIND:
+        application.job_queue.run_repeating(flush_points_job, interval=config.POINTS_FLUSH_INTERVAL)
+    if config.CHANNEL_REFRESH_INTERVAL > 0:
+        application.job_queue.run_repeating(refresher.refresh_job, interval=config.CHANNEL_REFRESH_INTERVAL, first=30)
+    return application
 
-    # Load Scheduled Jobs
-    print("Loading scheduled jobs...")
-    broadcast.load_jobs(application)
+def main():
+    if not config.BOT_TOKEN:
+        print("Error: BOT_TOKEN not found in config or env.")
+        return
+
+    # Init DB
+    database.init_db()
+    
+    # Build Application
+    application = build_application()
 
     # Start
     print(f"Bot started! Owner: {config.OWNER_USERNAME}")
-    keep_alive()
-    application.run_polling()
+    if config.BOT_MODE == 'webhook':
+        if not config.WEBHOOK_URL:
+            print("Error: WEBHOOK_URL is required in webhook mode.")
+            return
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(allowed_updates=config.ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main()
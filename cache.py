@@ -0,0 +1,52 @@
+import time
+
+
+class TTLCache:
+    """Small dict-backed cache whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, ttl, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key, value):
+        if key not in self._data and len(self._data) >= self.max_size:
+            self.prune()
+            if key not in self._data and len(self._data) >= self.max_size:
+                # Still full of live entries: drop the least recently set
+                for k in list(self._data)[:len(self._data) // 10 or 1]:
+                    del self._data[k]
+        # Re-inserted, not overwritten, so the dict stays ordered by last set()
+        self._data.pop(key, None)
+        self._data[key] = (value, time.monotonic() + self.ttl)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def prune(self):
+        now = time.monotonic()
+        for k in [k for k, (_, expires) in self._data.items() if expires < now]:
+            del self._data[k]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
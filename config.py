@@ -9,3 +9,90 @@ if OWNER_USERNAME:
     OWNER_USERNAME = OWNER_USERNAME.replace("@", "").lower()
 
 EXTERNAL_LINK = "https://www.bbgg6688.com/?invitationCode=7466367541"
+
+# Bot API endpoint override, e.g. http://127.0.0.1:8081/bot for a local server
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "")
+
+# Append every incoming update to this gzip JSONL file (for tools/replay.py).
+# The log contains user ids and messages; leave unset unless profiling.
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH", "")
+
+# Update delivery: "polling" (getUpdates) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public base URL, e.g. https://mybot.herokuapp.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # random per boot if unset
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Updates handled in parallel; each user's own updates still run in order (0 = one at a time)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+# Bot API connection pools (see transport.py): timeouts in seconds
+HTTP_POLL_TIMEOUT = float(os.getenv("HTTP_POLL_TIMEOUT", "30"))
+HTTP_INTERACTIVE_POOL_SIZE = int(os.getenv("HTTP_INTERACTIVE_POOL_SIZE", "16"))
+HTTP_INTERACTIVE_TIMEOUT = float(os.getenv("HTTP_INTERACTIVE_TIMEOUT", "15"))
+HTTP_INTERACTIVE_POOL_TIMEOUT = float(os.getenv("HTTP_INTERACTIVE_POOL_TIMEOUT", "5"))
+HTTP_BULK_POOL_SIZE = int(os.getenv("HTTP_BULK_POOL_SIZE", "32"))
+HTTP_BULK_TIMEOUT = float(os.getenv("HTTP_BULK_TIMEOUT", "30"))
+HTTP_BULK_POOL_TIMEOUT = float(os.getenv("HTTP_BULK_POOL_TIMEOUT", "60"))
+HTTP_BULK_HTTP2 = os.getenv("HTTP_BULK_HTTP2", "0") == "1"  # needs httpx[http2]
+# Only the update types the handlers use. chat_member must be asked for
+# explicitly; it feeds the local membership index (admin channels only)
+ALLOWED_UPDATES = ["message", "callback_query", "my_chat_member", "chat_member"]
+
+# SQLite storage profile (see benchmarks/bench_sqlite.py for the numbers behind the defaults)
+DB_PATH = os.getenv("DB_PATH", os.path.join(os.path.dirname(__file__), 'bot.db'))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "wal")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "normal")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Broadcast fan-out tuning (Telegram allows ~30 msg/s overall and ~1 msg/s per chat)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_PER_CHAT_RATE = float(os.getenv("BROADCAST_PER_CHAT_RATE", "1"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+
+# Join verification
+VERIFY_CONCURRENCY = int(os.getenv("VERIFY_CONCURRENCY", "10"))
+VERIFY_TIMEOUT = float(os.getenv("VERIFY_TIMEOUT", "5"))
+VERIFY_FAIL_FAST = os.getenv("VERIFY_FAIL_FAST", "0") == "1"
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+
+# Per-user throttle (see throttle.py): tokens per minute and burst size per action
+THROTTLE_START_PER_MINUTE = float(os.getenv("THROTTLE_START_PER_MINUTE", "6"))
+THROTTLE_START_BURST = float(os.getenv("THROTTLE_START_BURST", "3"))
+THROTTLE_VERIFY_PER_MINUTE = float(os.getenv("THROTTLE_VERIFY_PER_MINUTE", "4"))
+THROTTLE_VERIFY_BURST = float(os.getenv("THROTTLE_VERIFY_BURST", "2"))
+THROTTLE_CALLBACK_PER_MINUTE = float(os.getenv("THROTTLE_CALLBACK_PER_MINUTE", "30"))
+THROTTLE_CALLBACK_BURST = float(os.getenv("THROTTLE_CALLBACK_BURST", "10"))
+
+# Points accounting: with write-behind on, credits are grouped and written
+# in one transaction every POINTS_FLUSH_INTERVAL seconds (useful during spikes)
+POINTS_WRITE_BEHIND = os.getenv("POINTS_WRITE_BEHIND", "0") == "1"
+POINTS_FLUSH_INTERVAL = float(os.getenv("POINTS_FLUSH_INTERVAL", "2"))
+# Background refresh of channel titles, links and the bot's admin status
+CHANNEL_REFRESH_INTERVAL = float(os.getenv("CHANNEL_REFRESH_INTERVAL", "3600"))
+CHANNEL_REFRESH_CONCURRENCY = int(os.getenv("CHANNEL_REFRESH_CONCURRENCY", "4"))
+# Dead-channel circuit breaker: quarantine after this many dead-channel errors
+# in a row, then probe after CHANNEL_PROBE_SECONDS, doubling up to the max
+CHANNEL_QUARANTINE_AFTER = int(os.getenv("CHANNEL_QUARANTINE_AFTER", "3"))
+CHANNEL_PROBE_SECONDS = float(os.getenv("CHANNEL_PROBE_SECONDS", "3600"))
+CHANNEL_PROBE_MAX_SECONDS = float(os.getenv("CHANNEL_PROBE_MAX_SECONDS", str(24 * 3600)))
+# /importchannels: concurrent lookups, Bot API calls per second and file limits
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+IMPORT_RATE = float(os.getenv("IMPORT_RATE", "10"))
+IMPORT_MAX_LINES = int(os.getenv("IMPORT_MAX_LINES", "1000"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(256 * 1024)))
+# Entries shown (and cached in memory) by /leaderboard
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+# Users per keyset page when DMing a user segment
+DM_PAGE_SIZE = int(os.getenv("DM_PAGE_SIZE", "500"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+# How long to wait for more items of an album before broadcasting it
+ALBUM_WAIT_SECONDS = float(os.getenv("ALBUM_WAIT_SECONDS", "1.5"))
+
+# Scheduled posts
+TIMEZONE = os.getenv("TIMEZONE", "UTC")
+SCHEDULE_STAGGER_SECONDS = float(os.getenv("SCHEDULE_STAGGER_SECONDS", "5"))
@@ -1,9 +1,30 @@
 from peewee import *
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import collections
 import datetime
+import functools
 import json
-import os
+import sqlite3
+import threading
+import time
+import config
+import metrics
 
-db = SqliteDatabase(os.path.join(os.path.dirname(__file__), 'bot.db'))
+def storage_pragmas():
+    # Applied by peewee to every new connection, i.e. once per thread
+    return {
+        'journal_mode': config.SQLITE_JOURNAL_MODE,
+        'synchronous': config.SQLITE_SYNCHRONOUS,
+        'cache_size': -config.SQLITE_CACHE_SIZE_KB,  # negative = KiB, not pages
+        'mmap_size': config.SQLITE_MMAP_SIZE,
+        'busy_timeout': config.SQLITE_BUSY_TIMEOUT_MS,
+        'foreign_keys': 1,
+    }
+
+# Connections are per thread (peewee keeps connection state thread-local), so
+# WAL lets the bot's DB thread write while other threads keep reading.
+db = SqliteDatabase(config.DB_PATH, pragmas=storage_pragmas())
 
 class BaseModel(Model):
     class Meta:
@@ -19,6 +40,17 @@ class Channel(BaseModel):
     username = CharField(null=True) # @channelname, optional/changeable
     invite_link = CharField(null=True)  # Stored invite link
     added_at = DateTimeField(default=datetime.datetime.now)
+    # Kept current by the background refresher (refresher.py); None = not checked yet
+    bot_is_admin = BooleanField(null=True)
+    refreshed_at = DateTimeField(null=True)
+    # Delivery health, maintained by record_deliveries (see health.py)
+    sent_count = IntegerField(default=0)
+    failed_count = IntegerField(default=0)
+    avg_latency_ms = FloatField(null=True) # moving average
+    last_error = TextField(null=True)
+    last_error_at = DateTimeField(null=True)
+    consecutive_failures = IntegerField(default=0) # dead-channel errors in a row
+    quarantined_until = DateTimeField(null=True) # broadcasts skip the channel until then
 
 class ScheduledPost(BaseModel):
     schedule_time = CharField() # HH:MM string
@@ -28,67 +60,285 @@ class ScheduledPost(BaseModel):
 class User(BaseModel):
     user_id = IntegerField(unique=True)
     username = CharField(null=True)
-    points = IntegerField(default=0)
-    referrer_id = IntegerField(null=True)
+    points = IntegerField(default=0, index=True) # leaderboard ranks
+    referrer_id = IntegerField(null=True, index=True)
     joined_all = BooleanField(default=False)
     created_at = DateTimeField(default=datetime.datetime.now)
+    # Materialized referral counters, maintained by add_user/complete_verification
+    referral_count = IntegerField(default=0)
+    verified_referral_count = IntegerField(default=0)
+    blocked = BooleanField(default=False) # bot blocked by the user; skipped by DM broadcasts
 
 class BotSetting(BaseModel):
     key = CharField(unique=True)
     value = TextField()
     updated_at = DateTimeField(default=datetime.datetime.now)
 
+class Broadcast(BaseModel):
+    payload = TextField() # JSON string, same shape as ScheduledPost.message_data
+    source = CharField(default='live') # live | schedule:<id>
+    created_at = DateTimeField(default=datetime.datetime.now)
+    finished_at = DateTimeField(null=True)
+
+class OutboxItem(BaseModel):
+    # One row per (broadcast, channel): the durable record of who got the post
+    broadcast = ForeignKeyField(Broadcast, backref='items', on_delete='CASCADE')
+    channel_id = CharField()
+    status = CharField(default='pending') # pending | sending | sent | failed
+    attempts = IntegerField(default=0)
+    error = TextField(null=True)
+    updated_at = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        indexes = ((('broadcast', 'channel_id'), True), (('broadcast', 'status'), False))
+
+class ChannelMember(BaseModel):
+    # Local membership index, fed by chat_member updates and API fallbacks
+    channel_id = CharField()
+    user_id = IntegerField()
+    status = CharField() # member | administrator | creator | left | kicked | restricted
+    updated_at = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        indexes = ((('user_id', 'channel_id'), True),)
+
+# In-memory mirror of the Owner table. Owner checks run on every update, so
+# they read this set instead of querying SQLite.
+_owners = set()
+
+# Channels and settings are read on every /start, so they are cached too.
+# Mutations reload the cache straight away and bump _version, which lets
+# callers (e.g. the prebuilt /start keyboard) notice the change.
+_channels = ()
+_settings = {}
+_version = 0
+
+def _add_column_if_missing(table, column, ddl):
+    # Lightweight migration: only ALTER when the column is really absent
+    if column not in {c.name for c in db.get_columns(table)}:
+        db.execute_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+        return True
+    return False
+
+def _backfill_referral_counts():
+    # One-off full pass when the counter columns are first created
+    db.execute_sql(
+        'UPDATE user SET '
+        'referral_count = (SELECT COUNT(*) FROM user AS r WHERE r.referrer_id = user.user_id), '
+        'verified_referral_count = (SELECT COUNT(*) FROM user AS r '
+        'WHERE r.referrer_id = user.user_id AND r.joined_all = 1)'
+    )
+
 def init_db():
-    db.connect()
-    db.create_tables([Owner, Channel, ScheduledPost, User, BotSetting])
-    # Migration hack for invite_link
-    try:
-        db.execute_sql('ALTER TABLE channel ADD COLUMN invite_link VARCHAR')
-    except:
-        pass
+    db.connect(reuse_if_open=True)
+    db.create_tables([Owner, Channel, ScheduledPost, User, BotSetting, Broadcast, OutboxItem, ChannelMember])
+    _add_column_if_missing('channel', 'invite_link', 'VARCHAR')
+    _add_column_if_missing('channel', 'bot_is_admin', 'INTEGER')
+    _add_column_if_missing('channel', 'refreshed_at', 'DATETIME')
+    for column, ddl in (('sent_count', 'INTEGER NOT NULL DEFAULT 0'), ('failed_count', 'INTEGER NOT NULL DEFAULT 0'),
+                        ('avg_latency_ms', 'REAL'), ('last_error', 'TEXT'), ('last_error_at', 'DATETIME'),
+                        ('consecutive_failures', 'INTEGER NOT NULL DEFAULT 0'), ('quarantined_until', 'DATETIME')):
+        _add_column_if_missing('channel', column, ddl)
+    added = _add_column_if_missing('user', 'referral_count', 'INTEGER NOT NULL DEFAULT 0')
+    added |= _add_column_if_missing('user', 'verified_referral_count', 'INTEGER NOT NULL DEFAULT 0')
+    if added:
+        _backfill_referral_counts()
+    _add_column_if_missing('user', 'blocked', 'INTEGER NOT NULL DEFAULT 0')
+    # Created here rather than on the field: older DBs only just got the column
+    db.execute_sql('CREATE INDEX IF NOT EXISTS user_referral_count ON user (referral_count)')
+    load_owners()
+    load_channels()
+    load_settings()
+    load_leaderboards()
+
+def cache_version():
+    return _version
+
+def _bump():
+    global _version
+    _version += 1
+
+def load_owners():
+    _owners.clear()
+    _owners.update(o.username for o in Owner.select())
 
 def add_owner_safe(username):
     username = username.replace('@', '').lower()
     try:
         Owner.create(username=username)
+        _owners.add(username)
         return True
     except IntegrityError:
         return False
 
 def is_owner(username):
     if not username: return False
-    return Owner.select().where(Owner.username == username.replace('@', '').lower()).exists()
+    return username.replace('@', '').lower() in _owners
 
 def get_owners():
     return [o.username for o in Owner.select()]
 
 def remove_owner(username):
     username = username.replace('@', '').lower()
-    return Owner.delete().where(Owner.username == username).execute()
+    deleted = Owner.delete().where(Owner.username == username).execute()
+    _owners.discard(username)
+    return deleted
+
+def load_channels():
+    global _channels
+    _channels = tuple(Channel.select().order_by(Channel.id))
+    _bump()
 
-def add_channel_safe(channel_id, title, username, invite_link=None):
+def add_channel_safe(channel_id, title, username, invite_link=None, bot_is_admin=None):
     try:
-        Channel.create(channel_id=str(channel_id), title=title, username=username, invite_link=invite_link)
+        Channel.create(channel_id=str(channel_id), title=title, username=username, invite_link=invite_link,
+                       bot_is_admin=bot_is_admin, refreshed_at=datetime.datetime.now() if bot_is_admin is not None else None)
+        load_channels()
         return True
     except IntegrityError:
         return False
 
+def add_channels(rows):
+    """
+    Insert many channels ({channel_id, title, username, invite_link,
+    bot_is_admin} dicts) in one transaction, skipping ones that already
+    exist. Returns the set of channel_ids actually added.
+    """
+    if not rows:
+        return set()
+    now = datetime.datetime.now()
+    ids = [str(r['channel_id']) for r in rows]
+    with db.atomic():
+        existing = {cid for (cid,) in Channel.select(Channel.channel_id).where(Channel.channel_id.in_(ids)).tuples()}
+        new = [dict(r, channel_id=str(r['channel_id']), refreshed_at=now) for r in rows
+               if str(r['channel_id']) not in existing]
+        for batch in chunked(new, 100):
+            Channel.insert_many(batch).execute()
+    load_channels()
+    return {r['channel_id'] for r in new}
+
 def get_channels():
-    return Channel.select()
+    # Served from the cache; treat the returned rows as read-only
+    return _channels
 
-def remove_channel(channel_id):
-    return Channel.delete().where(Channel.channel_id == str(channel_id)).execute()
+def find_channel_by_username(username):
+    username = username.lstrip('@').lower()
+    for c in _channels:
+        if c.username and c.username.lstrip('@').lower() == username:
+            return c
+    return None
+
+def save_channel_refresh(results):
+    """
+    Store refreshed metadata, {channel_id: {field: value}}, in one transaction
+    and reload the channel cache once.
+    """
+    if not results:
+        return
+    now = datetime.datetime.now()
+    with db.atomic():
+        for channel_id, fields in results.items():
+            Channel.update(refreshed_at=now, **fields).where(Channel.channel_id == str(channel_id)).execute()
+    load_channels()
+
+def record_deliveries(stats):
+    """
+    Fold one batch of per-channel outcomes ({channel_id: {sent, failed,
+    latency_ms, error, dead}}) into the Channel rows and run the circuit
+    breaker. Returns the channels that were quarantined just now.
+    """
+    if not stats:
+        return []
+    now = datetime.datetime.now()
+    tripped = []
+    with db.atomic():
+        for channel_id, s in stats.items():
+            row = Channel.get_or_none(Channel.channel_id == str(channel_id))
+            if row is None:
+                continue
+            fields = {'sent_count': Channel.sent_count + s['sent'], 'failed_count': Channel.failed_count + s['failed']}
+            if s['latency_ms'] is not None:
+                old = row.avg_latency_ms
+                fields['avg_latency_ms'] = s['latency_ms'] if old is None else old * 0.8 + s['latency_ms'] * 0.2
+            if s['error']:
+                fields['last_error'] = s['error'][:300]
+                fields['last_error_at'] = now
+            if s['sent']:
+                fields['consecutive_failures'] = 0
+                fields['quarantined_until'] = None
+            elif s['dead']:
+                failures = row.consecutive_failures + 1
+                fields['consecutive_failures'] = failures
+                if failures >= config.CHANNEL_QUARANTINE_AFTER:
+                    # Every failed probe doubles the wait before the next one
+                    wait = min(config.CHANNEL_PROBE_MAX_SECONDS,
+                               config.CHANNEL_PROBE_SECONDS * 2 ** (failures - config.CHANNEL_QUARANTINE_AFTER))
+                    fields['quarantined_until'] = now + datetime.timedelta(seconds=wait)
+                    if row.quarantined_until is None:
+                        tripped.append(row)
+            Channel.update(**fields).where(Channel.id == row.id).execute()
+    load_channels()
+    return tripped
+
+# save_channel_refresh() fields that lift a quarantine once access is restored
+HEALTHY = {'consecutive_failures': 0, 'quarantined_until': None}
+
+def get_owner_user_ids():
+    # Owners are stored by username; their chat ids come from their User rows (set on /start)
+    owners = list(_owners)
+    if not owners:
+        return []
+    query = User.select(User.user_id).where(fn.LOWER(User.username).in_(owners))
+    return [u for u, in query.tuples()]
 
 def remove_channel(channel_id):
-    return Channel.delete().where(Channel.channel_id == str(channel_id)).execute()
+    deleted = Channel.delete().where(Channel.channel_id == str(channel_id)).execute()
+    if deleted:
+        forget_channel_members(channel_id)
+        load_channels()
+    return deleted
 
 def update_channel_id(old_id, new_id, new_title=None):
     try:
         q = Channel.update(channel_id=str(new_id), title=new_title if new_title else Channel.title).where(Channel.channel_id == str(old_id))
-        return q.execute()
+        updated = q.execute()
+        load_channels()
+        return updated
     except:
         return False
 
+# --- Membership index ---
+
+def get_member_statuses(user_id, channel_ids):
+    """{channel_id: status} for the channels the index has a row for, in one indexed query."""
+    query = (ChannelMember
+             .select(ChannelMember.channel_id, ChannelMember.status)
+             .where((ChannelMember.user_id == user_id) &
+                    (ChannelMember.channel_id.in_([str(c) for c in channel_ids]))))
+    return dict(query.tuples())
+
+def record_members(rows):
+    """
+    Upsert (channel_id, user_id, status, observed_at) rows. A row only
+    replaces one observed at the same time or earlier, so a slow API answer
+    can't overwrite a newer chat_member update.
+    """
+    if not rows:
+        return
+    with db.atomic():
+        (ChannelMember
+         .insert_many([(str(c), u, s, at) for c, u, s, at in rows],
+                      fields=[ChannelMember.channel_id, ChannelMember.user_id,
+                              ChannelMember.status, ChannelMember.updated_at])
+         .on_conflict(conflict_target=[ChannelMember.user_id, ChannelMember.channel_id],
+                      preserve=[ChannelMember.status, ChannelMember.updated_at],
+                      where=(EXCLUDED.updated_at >= ChannelMember.updated_at))
+         .execute())
+
+def forget_channel_members(channel_id):
+    # The index is only trustworthy while the bot receives the channel's updates
+    return ChannelMember.delete().where(ChannelMember.channel_id == str(channel_id)).execute()
+
 def add_schedule(time_str, msg_data):
     # time_str: "HH:MM"
     # msg_data: dict
@@ -98,38 +348,318 @@ def add_schedule(time_str, msg_data):
     )
 
 def get_all_schedules():
-    return ScheduledPost.select()
+    return list(ScheduledPost.select())
+
+def get_schedule(schedule_id):
+    return ScheduledPost.get_or_none(ScheduledPost.id == schedule_id)
 
 def delete_schedule(schedule_id):
     return ScheduledPost.delete().where(ScheduledPost.id == schedule_id).execute()
 
+# Broadcast outbox helpers
+def create_broadcast(msg_data, channel_ids, source='live', consume_schedule=None):
+    """
+    Persist a broadcast and its outbox rows; returns its id. With
+    `consume_schedule`, that one-shot ScheduledPost row is deleted in the
+    same transaction, so after a restart the outbox resumes the broadcast
+    and the schedule can't fire it again. Returns None if the row is
+    already gone (fired or deleted meanwhile).
+    """
+    with db.atomic():
+        if consume_schedule is not None and not delete_schedule(consume_schedule):
+            return None
+        broadcast = Broadcast.create(payload=json.dumps(msg_data), source=source)
+        rows = [{'broadcast': broadcast.id, 'channel_id': str(c)} for c in channel_ids]
+        for i in range(0, len(rows), 500):
+            OutboxItem.insert_many(rows[i:i + 500]).execute()
+    return broadcast.id
+
+def get_broadcast(broadcast_id):
+    return Broadcast.get_or_none(Broadcast.id == broadcast_id)
+
+def get_unfinished_broadcasts():
+    return list(Broadcast.select().where(Broadcast.finished_at.is_null()).order_by(Broadcast.id))
+
+def claim_outbox_batch(broadcast_id, limit):
+    # Move the next pending rows to 'sending' and return (item_id, channel_id) pairs
+    with db.atomic():
+        items = list(
+            OutboxItem.select(OutboxItem.id, OutboxItem.channel_id)
+            .where((OutboxItem.broadcast == broadcast_id) & (OutboxItem.status == 'pending'))
+            .order_by(OutboxItem.id).limit(limit).tuples()
+        )
+        if items:
+            OutboxItem.update(
+                status='sending', attempts=OutboxItem.attempts + 1, updated_at=datetime.datetime.now()
+            ).where(OutboxItem.id.in_([i for i, _ in items])).execute()
+    return items
+
+def mark_outbox_sent(*item_ids):
+    return OutboxItem.update(status='sent', error=None, updated_at=datetime.datetime.now()).where(
+        OutboxItem.id.in_(item_ids)
+    ).execute()
+
+def mark_outbox_failed(errors):
+    # errors: {item_id: message}
+    now = datetime.datetime.now()
+    with db.atomic():
+        for item_id, error in errors.items():
+            OutboxItem.update(status='failed', error=error[:500], updated_at=now).where(
+                OutboxItem.id == item_id
+            ).execute()
+
+def requeue_inflight_outbox():
+    # Rows left in 'sending' by a crash: we can't tell if Telegram got them, resend
+    return OutboxItem.update(status='pending').where(OutboxItem.status == 'sending').execute()
+
+def finish_broadcast(broadcast_id):
+    # Returns {status: count}
+    with db.atomic():
+        Broadcast.update(finished_at=datetime.datetime.now()).where(Broadcast.id == broadcast_id).execute()
+        rows = (OutboxItem.select(OutboxItem.status, fn.COUNT(OutboxItem.id))
+                .where(OutboxItem.broadcast == broadcast_id).group_by(OutboxItem.status).tuples())
+        return dict(rows)
+
+def prune_broadcasts(days=7):
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    return Broadcast.delete().where(Broadcast.finished_at < cutoff).execute()
+
 # User helpers
 def get_user(user_id):
     return User.get_or_none(User.user_id == user_id)
 
 def add_user(user_id, username, referrer_id=None):
+    # Returning users (the common /start) cost one indexed lookup
+    user = get_user(user_id)
+    if user is not None:
+        if user.blocked:
+            # A returning user can receive DMs again
+            User.update(blocked=False).where(User.user_id == user_id).execute()
+            user.blocked = False
+        return user
     try:
-        return User.create(user_id=user_id, username=username, referrer_id=referrer_id)
+        with db.atomic():
+            # Users may have been referred before they started the bot themselves;
+            # both counters come from one query on the referrer_id index
+            invited, verified = User.select(
+                fn.COUNT(User.id), fn.COALESCE(fn.SUM(User.joined_all), 0)
+            ).where(User.referrer_id == user_id).tuples().get()
+            user = User.create(
+                user_id=user_id, username=username, referrer_id=referrer_id,
+                referral_count=invited, verified_referral_count=verified
+            )
+            if referrer_id:
+                for count, name in _increment(User.referral_count, 1, referrer_id):
+                    referral_leaders.update(referrer_id, count, name)
+            return user
     except IntegrityError:
+        # Created concurrently by another /start
         return get_user(user_id)
 
+# UPDATE ... RETURNING needs SQLite 3.35+
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _increment(field, amount, user_id):
+    """Add `amount` to one user's `field`; returns [(new value, username)], empty for unknown users."""
+    query = User.update({field: field + amount}).where(User.user_id == user_id)
+    if HAS_RETURNING:
+        return list(query.returning(field, User.username).tuples().execute())
+    # Older SQLite: read the new value back inside the same transaction
+    with db.atomic():
+        if not query.execute():
+            return []
+        return list(User.select(field, User.username).where(User.user_id == user_id).tuples())
+
 def add_points(user_id, amount):
-    user = get_user(user_id)
-    if user:
-        user.points += amount
-        user.save()
-        return True
-    return False
+    # Single atomic UPDATE: no read-modify-write, so concurrent credits can't be lost.
+    # The new total comes back for the leaderboard without another query where SQLite allows.
+    rows = _increment(User.points, amount, user_id)
+    for points, name in rows:
+        points_leaders.update(user_id, points, name)
+    return bool(rows)
+
+# --- Leaderboards ---
+
+class Leaderboard:
+    """
+    In-memory top-K of users by one score column, kept current by the code
+    paths that change that column. Reads never touch SQLite. A top member
+    whose score drops could be overtaken by someone outside the cache, so a
+    drop marks it stale and the next read reloads it (one indexed query).
+    """
+
+    def __init__(self, field, size):
+        self.field = field
+        self.size = size
+        self._top = {}  # user_id -> (score, username)
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = (User.select(User.user_id, self.field, User.username)
+                .where(self.field > 0).order_by(self.field.desc(), User.user_id).limit(self.size).tuples())
+        with self._lock:
+            self._top = {user_id: (score, name) for user_id, score, name in rows}
+            self._stale = False
+
+    def update(self, user_id, score, name):
+        with self._lock:
+            if self._stale:
+                return
+            current = self._top.get(user_id)
+            if current is not None and score < current[0]:
+                self._stale = True
+                return
+            if current is None and len(self._top) >= self.size and score <= self._floor():
+                return
+            self._top[user_id] = (score, name)
+            if len(self._top) > self.size:
+                del self._top[min(self._top, key=lambda u: (self._top[u][0], -u))]
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def _floor(self):
+        return min(score for score, _ in self._top.values())
+
+    def top(self, n=None):
+        """[(user_id, score, username)], best first."""
+        if self._stale:
+            self.load()
+        with self._lock:
+            ranked = sorted(self._top.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return [(user_id, score, name) for user_id, (score, name) in ranked[:n or self.size]]
+
+points_leaders = Leaderboard(User.points, config.LEADERBOARD_SIZE)
+referral_leaders = Leaderboard(User.referral_count, config.LEADERBOARD_SIZE)
+
+def load_leaderboards():
+    points_leaders.load()
+    referral_leaders.load()
+
+def get_leaderboards(n=None):
+    return points_leaders.top(n), referral_leaders.top(n)
+
+def get_rank(user_id):
+    """(rank, points) by points, ties sharing a rank, or None for unknown users. Two index lookups."""
+    points = User.select(User.points).where(User.user_id == user_id).scalar()
+    if points is None:
+        return None
+    return User.select().where(User.points > points).count() + 1, points
+
+# --- User segments (DM broadcasts) ---
+
+def _segment_where(segment, min_points=0):
+    where = User.blocked == False
+    if segment == 'joined':
+        where &= User.joined_all == True
+    elif segment == 'minpoints':
+        where &= User.points >= min_points
+    return where
+
+def count_segment(segment, min_points=0):
+    return User.select().where(_segment_where(segment, min_points)).count()
+
+def get_segment_page(segment, after_id=0, limit=500, min_points=0):
+    """
+    Next page of (row id, user_id) with row id > after_id. Keyset pagination:
+    every page is a primary-key range scan, however deep into the table.
+    """
+    query = (User.select(User.id, User.user_id)
+             .where(_segment_where(segment, min_points) & (User.id > after_id))
+             .order_by(User.id).limit(limit))
+    return list(query.tuples())
+
+def mark_users_blocked(user_ids):
+    if not user_ids:
+        return 0
+    return User.update(blocked=True).where(User.user_id.in_(list(user_ids))).execute()
+
+class PointsBuffer:
+    """Write-behind buffer that merges point credits and applies them in one transaction."""
+
+    def __init__(self):
+        self._pending = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, user_id, amount):
+        with self._lock:
+            self._pending[user_id] += amount
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, collections.defaultdict(int)
+        if not pending:
+            return 0
+        try:
+            with db.atomic():
+                for user_id, amount in pending.items():
+                    add_points(user_id, amount)
+        except Exception:
+            # Rolled back: put the credits back so the next flush retries them
+            with self._lock:
+                for user_id, amount in pending.items():
+                    self._pending[user_id] += amount
+            # The leaderboard may have seen totals that were never committed
+            points_leaders.invalidate()
+            raise
+        return len(pending)
+
+    def __len__(self):
+        return len(self._pending)
+
+points_buffer = PointsBuffer()
+
+def credit_points(user_id, amount):
+    # Immediate atomic credit, or buffered when write-behind is enabled
+    if config.POINTS_WRITE_BEHIND:
+        points_buffer.add(user_id, amount)
+    else:
+        add_points(user_id, amount)
+
+def flush_points():
+    return points_buffer.flush()
+
+def complete_verification(user_id, points, referral_points):
+    """
+    Mark `user_id` as joined_all and credit them and their referrer in one
+    transaction. Returns (verified, referrer_id); verified is False when the
+    user is unknown or was already verified, in which case nothing is credited.
+    """
+    with db.atomic():
+        # The joined_all guard makes the flag flip and the credit happen at most once
+        updated = User.update(joined_all=True).where(
+            (User.user_id == user_id) & (User.joined_all == False)
+        ).execute()
+        if not updated:
+            return False, None
+        credit_points(user_id, points)
+        referrer_id = User.select(User.referrer_id).where(User.user_id == user_id).scalar()
+        if referrer_id:
+            credit_points(referrer_id, referral_points)
+            User.update(verified_referral_count=User.verified_referral_count + 1).where(
+                User.user_id == referrer_id
+            ).execute()
+    return True, referrer_id
 
 def get_referral_count(user_id):
-    return User.select().where(User.referrer_id == user_id).count()
+    return User.select(User.referral_count).where(User.user_id == user_id).scalar() or 0
+
+def get_referral_counts(user_id):
+    # (invited, verified invited) straight from the materialized counters
+    row = User.select(User.referral_count, User.verified_referral_count).where(
+        User.user_id == user_id
+    ).tuples().first()
+    return row or (0, 0)
+
+def load_settings():
+    _settings.clear()
+    _settings.update((s.key, s.value) for s in BotSetting.select())
+    _bump()
 
 def get_setting(key, default=None):
-    try:
-        s = BotSetting.get(BotSetting.key == key)
-        return s.value
-    except DoesNotExist:
-        return default
+    return _settings.get(key, default)
 
 def set_setting(key, value):
     try:
@@ -137,10 +667,51 @@ def set_setting(key, value):
         if not created:
             obj.value = value
             obj.save()
+        _settings[key] = value
+        _bump()
         return True
     except:
         return False
 
+# --- Async access ---
+# Peewee is synchronous. Handlers must not run queries on the event loop, so
+# all DB work goes through one dedicated thread: the loop stays free and
+# SQLite writes are naturally serialized.
+def _connect_thread():
+    db.connect(reuse_if_open=True)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db', initializer=_connect_thread)
+
+async def run(func, *args, **kwargs):
+    """Run a blocking DB callable on the DB thread and await its result."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        metrics.DB_SECONDS.observe(time.perf_counter() - start, getattr(func, '__name__', 'query'))
+
+class _Async:
+    """
+    Awaitable mirror of the module helpers: `await database.aio.get_user(uid)`
+    runs `get_user(uid)` on the DB thread. Cached readers (is_owner,
+    get_channels, get_setting) never block and may also be called directly.
+    """
+
+    def __getattr__(self, name):
+        func = globals().get(name)
+        if name.startswith('_') or not callable(func) or isinstance(func, type):
+            raise AttributeError(name)
+
+        @functools.wraps(func)
+        async def call(*args, **kwargs):
+            # Looked up per call (not cached), so rebinding database.<name> takes effect here too
+            return await run(globals()[name], *args, **kwargs)
+
+        return call
+
+aio = _Async()
+
 if __name__ == '__main__':
     init_db()
     print("Database initialized.")
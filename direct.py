@@ -0,0 +1,71 @@
+"""
+Direct-message broadcasts to the bot's users.
+
+Users are streamed from the User table one keyset page at a time
+(DM_PAGE_SIZE rows), and each page goes through the shared fan-out engine,
+so memory stays flat for any table size. Throughput is capped by the global
+broadcast rate, which makes the completion time predictable:
+users / BROADCAST_GLOBAL_RATE seconds. Users who blocked the bot (Forbidden)
+are flagged and skipped by later runs until they /start the bot again.
+"""
+import logging
+import time
+
+from telegram.error import Forbidden
+
+import config
+import database
+import fanout
+import outbox
+import transport
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS = ('all', 'joined', 'minpoints')
+
+
+class DMRun:
+    def __init__(self, segment, min_points=0, total=0):
+        self.segment = segment
+        self.min_points = min_points
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.cancelled = False
+        self.started = time.monotonic()
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.blocked
+
+    def eta(self):
+        return max(0, self.total - self.done) / config.BROADCAST_GLOBAL_RATE
+
+    def describe(self):
+        name = f"minpoints {self.min_points}" if self.segment == 'minpoints' else self.segment
+        return (f"DM to {name}: {self.done}/{self.total} "
+                f"(sent {self.sent}, blocked {self.blocked}, failed {self.failed})")
+
+
+async def send_to_segment(bot, data, run, progress=None):
+    """Deliver `data` to every user in the run's segment; `progress(run)` is awaited after each page."""
+    bot = transport.bulk_bot or bot
+    after_id = 0
+    while not run.cancelled:
+        page = await database.aio.get_segment_page(run.segment, after_id, config.DM_PAGE_SIZE, run.min_points)
+        if not page:
+            break
+        after_id = page[-1][0]
+
+        result = await fanout.engine.run([user_id for _, user_id in page], lambda chat_id: outbox.deliver(bot, chat_id, data))
+        blocked = [user_id for user_id, e in result.failed.items() if isinstance(e, Forbidden)]
+        await database.aio.mark_users_blocked(blocked)
+        run.sent += len(result.sent)
+        run.blocked += len(blocked)
+        run.failed += len(result.failed) - len(blocked)
+        if progress:
+            await progress(run)
+
+    logger.info("%s%s", run.describe(), " (cancelled)" if run.cancelled else "")
+    return run
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import random
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+import config
+import metrics
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Errors that will not go away by retrying (kicked, chat not found, bad payload)
+PERMANENT_ERRORS = (Forbidden, BadRequest)
+
+
+class FanOutResult:
+    def __init__(self):
+        self.sent = []
+        self.failed = {}  # chat_id -> exception
+
+    def __repr__(self):
+        return f"<FanOutResult sent={len(self.sent)} failed={len(self.failed)}>"
+
+
+class FanOut:
+    """
+    Sends one message to many chats with bounded concurrency.
+
+    A single global bucket keeps the bot under Telegram's overall limit and a
+    bucket per chat keeps consecutive posts to the same chat spaced out.
+    RetryAfter and transient network errors are retried with backoff.
+    """
+
+    def __init__(self, rate, per_chat_rate, concurrency, max_retries):
+        self.per_chat_rate = per_chat_rate
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._global = TokenBucket(rate)
+        self._per_chat = {}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._per_chat.get(chat_id)
+        if bucket is None:
+            bucket = self._per_chat[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        return bucket
+
+    def _prune(self):
+        # Idle buckets carry no state, drop them so the map doesn't grow forever
+        for chat_id in [c for c, b in self._per_chat.items() if b.full]:
+            del self._per_chat[chat_id]
+
+    async def send(self, chat_id, send):
+        """Deliver to one chat; returns None on success or the final exception."""
+        error = await self._send(chat_id, send)
+        if error is not None:
+            metrics.BROADCAST_FAILURES.inc(type(error).__name__)
+        return error
+
+    async def _send(self, chat_id, send):
+        attempt = 0
+        while True:
+            await self._chat_bucket(chat_id).acquire()
+            await self._global.acquire()
+            try:
+                await send(chat_id)
+                metrics.BROADCAST_SENDS.inc()
+                return None
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so stall everyone
+                self._global.pause(e.retry_after)
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                error = e
+            except PERMANENT_ERRORS as e:
+                return e
+            except NetworkError as e:
+                error = e
+            except TelegramError as e:
+                return e
+
+            attempt += 1
+            if attempt > self.max_retries:
+                return error
+            if not isinstance(error, RetryAfter):
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt) + random.random() * 0.5)
+            metrics.BROADCAST_RETRIES.inc(type(error).__name__)
+            logger.info("Retrying %s (attempt %d): %s", chat_id, attempt, error)
+
+    async def run(self, chat_ids, send):
+        """Fan `send(chat_id)` out to every chat and collect the outcome."""
+        result = FanOutResult()
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def worker(chat_id):
+            async with sem:
+                error = await self.send(chat_id, send)
+            if error is None:
+                result.sent.append(chat_id)
+            else:
+                result.failed[chat_id] = error
+
+        await asyncio.gather(*(worker(c) for c in chat_ids))
+        self._prune()
+        return result
+
+
+# Shared by every broadcast path so concurrent broadcasts respect the same limits
+engine = FanOut(
+    rate=config.BROADCAST_GLOBAL_RATE,
+    per_chat_rate=config.BROADCAST_PER_CHAT_RATE,
+    concurrency=config.BROADCAST_CONCURRENCY,
+    max_retries=config.BROADCAST_MAX_RETRIES,
+)
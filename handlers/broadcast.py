@@ -1,67 +1,194 @@
+import logging
+
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, MessageHandler, filters, CommandHandler
+import config
 import database
-import json
-import datetime
+import direct
+import outbox
+import scheduler
+from auth import OWNER
 import asyncio
 
+logger = logging.getLogger(__name__)
+
+# --- Album buffering ---
+# Telegram delivers each album item as its own update. Items are collected per
+# media_group_id until ALBUM_WAIT_SECONDS pass without a new one, then the
+# album goes out as a single send_media_group per channel.
+_albums = {}  # media_group_id -> {'messages': [...], 'timer': Task}
+
+def _album_item(message):
+    # Serializable InputMedia description for one album message
+    if message.photo:
+        kind, media = 'photo', message.photo[-1].file_id
+    elif message.video:
+        kind, media = 'video', message.video.file_id
+    elif message.document:
+        kind, media = 'document', message.document.file_id
+    elif message.audio:
+        kind, media = 'audio', message.audio.file_id
+    else:
+        return None
+    item = {'type': kind, 'media': media}
+    if message.caption:
+        item['caption'] = message.caption
+        if message.caption_entities:
+            item['caption_entities'] = [e.to_dict() for e in message.caption_entities]
+    return item
+
+def _buffer_album_item(message, context):
+    album = _albums.setdefault(message.media_group_id, {'messages': [], 'timer': None})
+    album['messages'].append(message)
+    if album['timer']:
+        album['timer'].cancel()
+    album['timer'] = context.application.create_task(_flush_album(message.media_group_id, context))
+
+async def _flush_album(media_group_id, context):
+    await asyncio.sleep(config.ALBUM_WAIT_SECONDS)
+    album = _albums.pop(media_group_id)
+    messages = sorted(album['messages'], key=lambda m: m.message_id)
+    media = [item for item in map(_album_item, messages) if item]
+
+    counts = await outbox.submit(context.bot, {'type': 'album', 'media': media})
+    await context.bot.send_message(
+        chat_id=messages[0].chat_id,
+        text=f"✅ Album ({len(media)} items) sent to {counts.get('sent', 0)} channels.{_skipped(counts)}",
+        reply_to_message_id=messages[0].message_id
+    )
+
+def _skipped(counts):
+    quarantined = counts.get('quarantined')
+    return f"\n⛔ Skipped {quarantined} quarantined channels (see /listchannels)." if quarantined else ""
+
 # --- Broadcast Handler ---
 async def broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not user or not database.is_owner(user.username):
-        return # Ignore non-owners
-    
     # Ignore commands
     if update.message.text and update.message.text.startswith('/'):
         return
 
-    channels = database.get_channels()
-    count = 0
-    
+    if update.message.media_group_id:
+        _buffer_album_item(update.message, context)
+        return
+
     # Replicate message content
     # We use copy_message which is cleaner!
-    
-    for ch in channels:
+    # Goes through the durable outbox, so a restart mid-broadcast resumes it
+    counts = await outbox.submit(context.bot, {
+        'type': 'copy',
+        'from_chat_id': update.effective_chat.id,
+        'message_id': update.message.message_id
+    })
+
+    await update.message.reply_text(f"✅ Sent to {counts.get('sent', 0)} channels.{_skipped(counts)}")
+
+# --- Direct messages to users ---
+
+DM_USAGE = (
+    "Usage (reply to a message to send it OR type text):\n"
+    "/dm all <text> - every user\n"
+    "/dm joined <text> - users who verified\n"
+    "/dm minpoints <N> <text> - users with at least N points\n"
+    "/dm status | /dm cancel"
+)
+
+_dm = {'run': None}  # the DM broadcast in progress, one at a time
+
+async def dm_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    run = _dm['run']
+    if args and args[0].lower() in ('status', 'cancel'):
+        if not run:
+            await update.message.reply_text("No DM broadcast running.")
+        elif args[0].lower() == 'cancel':
+            run.cancelled = True
+            await update.message.reply_text(f"🛑 Cancelling after the current page.\n{run.describe()}")
+        else:
+            await update.message.reply_text(f"{run.describe()}\nETA: {run.eta() / 60:.0f} min")
+        return
+
+    if not args or args[0].lower() not in direct.SEGMENTS:
+        await update.message.reply_text(DM_USAGE)
+        return
+    if run:
+        await update.message.reply_text(f"⚠️ A DM broadcast is already running.\n{run.describe()}")
+        return
+
+    segment, rest, min_points = args[0].lower(), args[1:], 0
+    if segment == 'minpoints':
+        if not rest or not rest[0].isdigit():
+            await update.message.reply_text(DM_USAGE)
+            return
+        min_points, rest = int(rest[0]), rest[1:]
+
+    message = update.message.reply_to_message
+    if message:
+        data = {'type': 'copy', 'from_chat_id': message.chat_id, 'message_id': message.message_id}
+    elif rest:
+        data = {'type': 'text', 'text': ' '.join(rest)}
+    else:
+        await update.message.reply_text("❌ Provide text or reply to a message.")
+        return
+
+    async def progress(run):
         try:
-            await context.bot.copy_message(
-                chat_id=ch.channel_id,
-                from_chat_id=update.effective_chat.id,
-                message_id=update.message.message_id
-            )
-            count += 1
-        except Exception as e:
-            print(f"Failed to send to {ch.title}: {e}")
+            await status.edit_text(f"📨 {run.describe()}\nETA: {run.eta() / 60:.0f} min")
+        except Exception:
+            pass  # e.g. "message is not modified"
 
-    await update.message.reply_text(f"✅ Sent to {count} channels.")
+    async def send():
+        try:
+            await direct.send_to_segment(context.bot, data, run, progress)
+        except Exception as e:
+            # A background task's exception is only logged by PTB; tell the owner what got out
+            logger.exception("DM broadcast failed")
+            await update.message.reply_text(f"❌ DM broadcast failed: {e}\n{run.describe()}")
+        else:
+            done = "🛑 Cancelled" if run.cancelled else "✅ Done"
+            await update.message.reply_text(f"{done}. {run.describe()}")
+        finally:
+            _dm['run'] = None
+
+    # Claim the slot before any await so two /dm commands can't both start
+    run = _dm['run'] = direct.DMRun(segment, min_points)
+    try:
+        run.total = await database.aio.count_segment(segment, min_points)
+        status = await update.message.reply_text(f"📨 Sending to {run.total} users, ETA {run.eta() / 60:.0f} min.")
+        # Runs in the background: it can take hours and must not hold up the owner's other updates
+        context.application.create_task(send(), update=update)
+    except Exception:
+        # Nothing started: free the slot, or every later /dm reports a run in progress
+        _dm['run'] = None
+        raise
 
 # --- Scheduler Handlers ---
 
-async def schedule_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username): return
+SCHEDULE_USAGE = (
+    "Usage (reply to a message to schedule it OR type text):\n"
+    "/schedule HH:MM <text> - daily\n"
+    "/schedule cron <min> <hour> <day> <month> <weekday> <text>\n"
+    "/schedule once YYYY-MM-DD HH:MM <text>\n"
+    f"Times are in {config.TIMEZONE}."
+)
 
+async def schedule_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args or len(context.args) < 1:
-        await update.message.reply_text("Usage: /schedule HH:MM <reply to message to schedule OR type text>")
+        await update.message.reply_text(SCHEDULE_USAGE)
         return
 
-    time_str = context.args[0]
     # Validate time format
     try:
-        datetime.datetime.strptime(time_str, "%H:%M")
-    except ValueError:
-        await update.message.reply_text("❌ Invalid format. Use HH:MM (24-hour).")
+        spec, rest = scheduler.parse_command(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Invalid schedule: {e}\n\n{SCHEDULE_USAGE}")
         return
 
     # Check for reply
     message = update.message.reply_to_message
     if message:
         # Schedule the replied message
-        # We need to save enough info to reconstruct it.
-        # But `copy_message` requires the message to exist. 
-        # If we restart, we can't copy from an old message ID potentially if chat history is gone? 
-        # Actually message_id in a private chat with bot persists. So saving message_id and chat_id is OK.
-        
+        # message_id in a private chat with bot persists, so saving message_id and chat_id is OK.
         msg_data = {
             'type': 'copy',
             'from_chat_id': message.chat_id,
@@ -69,7 +196,7 @@ async def schedule_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }
     else:
         # Schedule the text remainder
-        text = ' '.join(context.args[1:])
+        text = ' '.join(rest)
         if not text:
              await update.message.reply_text("❌ Provide text or reply to a message.")
              return
@@ -78,172 +205,48 @@ async def schedule_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'text': text
         }
 
-    job = database.add_schedule(time_str, msg_data)
-    
-    # Add to APScheduler
-    # We assume 'scheduler' is passed in bot_data or we need to access it.
-    # Actually, we should trigger a reload or add manually.
-    # Ideally, we access context.application.job_queue? Not quite APScheduler.
-    # The plan was to use APScheduler.
-    # Helper to add job:
-    add_job_to_scheduler(context.application.scheduler, job)
+    job = await database.aio.add_schedule(spec, msg_data)
+    schedule = scheduler.dispatcher.add(job)
+    next_run = scheduler.dispatcher.next_run(job.id)
 
-    await update.message.reply_text(f"✅ Post scheduled for {time_str} daily. ID: {job.id}")
+    await update.message.reply_text(
+        f"✅ Post scheduled ({schedule.describe()}). ID: {job.id}\n"
+        f"Next run: {next_run:%Y-%m-%d %H:%M %Z}"
+    )
 
 async def list_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not database.is_owner(update.effective_user.username): return
-    
-    posts = database.get_all_schedules()
-    text = "📅 *Daily Schedule:*\n"
+    posts = await database.aio.get_all_schedules()
+    text = "📅 *Schedule:*\n"
     for p in posts:
-        data = json.loads(p.message_data)
-        content_preview = data.get('text', 'Media/Copy')[:20]
-        text += f"ID: `{p.id}` | Time: `{p.schedule_time}` | {content_preview}\n"
+        schedule = scheduler.dispatcher.get(p.id)
+        if not schedule:
+            continue
+        content_preview = schedule.data.get('text', 'Media/Copy')[:20]
+        next_run = scheduler.dispatcher.next_run(p.id)
+        text += f"ID: `{p.id}` | `{schedule.describe()}` | next `{next_run:%m-%d %H:%M}` | {content_preview}\n"
     
     await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
 
 async def delete_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not database.is_owner(update.effective_user.username): return
-    
-    if not context.args:
+    if not context.args or not context.args[0].isdigit():
         await update.message.reply_text("Usage: /deleteschedule ID")
         return
         
-    job_id = context.args[0]
-    # Remove from DB
-    database.delete_schedule(job_id)
-    # Remove from APScheduler
-    try:
-        context.application.scheduler.remove_job(str(job_id))
+    job_id = int(context.args[0])
+    # Remove from DB and from the dispatcher
+    if await database.aio.delete_schedule(job_id):
+        scheduler.dispatcher.remove(job_id)
         await update.message.reply_text(f"🗑️ Schedule {job_id} deleted.")
-    except Exception as e:
-         await update.message.reply_text(f"🗑️ Deleted from DB, but scheduler error: {e}")
-
-# --- Scheduler Logic ---
-
-def run_scheduled_post(bot, job_db_id):
-    # This function is called by APScheduler
-    # We need to run it in async loop? 
-    # APScheduler AsyncIOScheduler runs async functions.
-    pass 
-
-async def send_post_job(context):
-    # context.job.context contains the data passed
-    # But wait, APScheduler is separate from PTB JobQueue usually?
-    # If we use PTB JobQueue, it's easier.
-    # But user asked for "APScheduler".
-    # I will stick to PTB JobQueue? No, user accepted my plan for APScheduler.
-    # Actually PTB v20 has a built-in JobQueue.
-    # Using PTB JobQueue is WAY easier for integration.
-    # Does "APScheduler" requirement imply external library? 
-    # PTB uses APScheduler internally (up to v13) but v20 uses its own?
-    # Actually PTB v20 JobQueue IS based on logic but handles the loop.
-    # I will use Generic APScheduler for robustness if requested, BUT integration with `bot` instance is key.
-    # I'll use `AsyncIOScheduler`.
-    
-    job_id = context # passed arg
-    # Fetch latest from DB (in case changed)
-    # Wait, how to get DB record?
-    # It's better to pass the data.
-    pass
-
-async def execute_job(application, job_model):
-    # Fetch fresh logic
-    channels = database.get_channels()
-    data = json.loads(job_model.message_data)
-    
-    for ch in channels:
-        try:
-            if data['type'] == 'copy':
-                await application.bot.copy_message(
-                    chat_id=ch.channel_id,
-                    from_chat_id=data['from_chat_id'],
-                    message_id=data['message_id']
-                )
-            elif data['type'] == 'text':
-                await application.bot.send_message(
-                    chat_id=ch.channel_id,
-                    text=data['text']
-                )
-        except Exception as e:
-            print(f"Broadcast failed for {ch.title}: {e}")
-
-# Helper to register
-def add_job_to_scheduler(scheduler, job_model):
-    # job_model is DB object
-    # scheduler is AsyncIOScheduler
-    
-    # Parse HH:MM
-    h, m = map(int, job_model.schedule_time.split(':'))
-    
-    # Function to run
-    async def job_func():
-        # access app? We need 'application' instance. 
-        # We can bind it using partial or passing it via kwargs if supported.
-        pass
-    
-    # This is getting complex to link 'application' inside independent scheduler.
-    # Alternative: Use PTB's JobQueue.
-    # It supports `.run_daily`.
-    # `context.job_queue.run_daily(callback, time=..., data=job_model.id)`
-    # Only verify if `python-telegram-bot` v20 `JobQueue` supports persistency? No.
-    # So I need to restore from DB on startup.
-    # I will use PTB's `JobQueue` because it has the `context` with `bot`.
-    # It acts like APScheduler.
-    pass
-
-# We'll expose a `load_jobs(application)` function to call on startup.
-
-async def job_callback(context: ContextTypes.DEFAULT_TYPE):
-    job_db_id = context.job.data
-    # Get from DB
-    try:
-        # We need a direct get method or select
-        post = database.ScheduledPost.get_by_id(job_db_id)
-        
-        channels = database.get_channels()
-        data = json.loads(post.message_data)
-        
-        for ch in channels:
-            try:
-                if data['type'] == 'copy':
-                    await context.bot.copy_message(
-                        chat_id=ch.channel_id,
-                        from_chat_id=data['from_chat_id'],
-                        message_id=data['message_id']
-                    )
-                elif data['type'] == 'text':
-                    await context.bot.send_message(
-                        chat_id=ch.channel_id,
-                        text=data['text']
-                    )
-            except Exception as e:
-                print(f"Auto-post failed: {e}")
-                
-    except Exception as e:
-        print(f"Job error {job_db_id}: {e}")
-
-def load_jobs(application):
-    posts = database.get_all_schedules()
-    for p in posts:
-        h, m = map(int, p.schedule_time.split(':'))
-        t = datetime.time(hour=h, minute=m)
-        application.job_queue.run_daily(job_callback, t, data=p.id, name=str(p.id))
-
-# Override add_job_to_scheduler for PTB logic
-def add_job_to_scheduler(scheduler, job_model):
-    # scheduler here is actually application.job_queue (hacky check)
-    # We'll pass job_queue directly
-    h, m = map(int, job_model.schedule_time.split(':'))
-    t = datetime.time(hour=h, minute=m)
-    scheduler.run_daily(job_callback, t, data=job_model.id, name=str(job_model.id))
-
+    else:
+        await update.message.reply_text(f"⚠️ Schedule {job_id} not found.")
 
 def get_handlers():
     return [
-        CommandHandler("schedule", schedule_post),
-        CommandHandler("listschedule", list_schedule),
-        CommandHandler("deleteschedule", delete_schedule),
-        # Broadcast is a MessageHandler, should be last
-        MessageHandler(filters.ALL & (~filters.COMMAND), broadcast_message)
+        CommandHandler("schedule", schedule_post, filters=OWNER),
+        CommandHandler("listschedule", list_schedule, filters=OWNER),
+        CommandHandler("deleteschedule", delete_schedule, filters=OWNER),
+        CommandHandler("dm", dm_users, filters=OWNER),
+        # Broadcast is a MessageHandler, should be last.
+        # Non-owner messages never reach it thanks to the OWNER filter.
+        MessageHandler(filters.ALL & (~filters.COMMAND) & OWNER, broadcast_message)
     ]
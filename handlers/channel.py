@@ -1,13 +1,17 @@
-from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+import logging
+
+from telegram import InputFile, Update
+from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
 from telegram.error import TelegramError
+import config
 import database
+import health
+import importer
+from auth import OWNER
 
-async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
+logger = logging.getLogger(__name__)
 
+async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("Usage:\nPublic: `/addchannel https://t.me/channel`\nPrivate: `/addchannel -100xxxx https://t.me/+abcd...`", parse_mode='Markdown')
         return
@@ -69,7 +73,7 @@ async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Use a generic title since we can't fetch it
             dummy_title = f"Channel {int(time.time())}" # TODO: Allow user to set title
             
-            if database.add_channel_safe(dummy_id, dummy_title, None, invite_link):
+            if await database.aio.add_channel_safe(dummy_id, dummy_title, None, invite_link):
                 await update.message.reply_text(
                     f"✅ Private Link Added!\n\n"
                     f"⚠️ **Note:** Since no ID was provided, bot cannot verify members for this channel.\n"
@@ -94,9 +98,11 @@ async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Check admin rights
+        bot_is_admin = None
         try:
             member = await chat.get_member(context.bot.id)
-            if member.status not in ['administrator', 'creator']:
+            bot_is_admin = member.status in ['administrator', 'creator']
+            if not bot_is_admin:
                 await update.message.reply_text("⚠️ I am not an admin in that channel. I added it, but I cannot verify members until I am admin.")
         except:
              await update.message.reply_text("⚠️ Could not check admin status.")
@@ -115,7 +121,7 @@ async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not final_link:
              final_link = "https://t.me/"
 
-        if database.add_channel_safe(chat.id, chat.title, final_username, final_link):
+        if await database.aio.add_channel_safe(chat.id, chat.title, final_username, final_link, bot_is_admin):
             await update.message.reply_text(f"✅ Channel '{chat.title}' added!\nLink: {final_link}")
         else:
             await update.message.reply_text("⚠️ Channel already exists.")
@@ -124,10 +130,6 @@ async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Error finding channel: {e}")
 
 async def remove_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
-    
     if not context.args:
          # User requested to see data when clicking remove (running command without args)
          channels = database.get_channels()
@@ -149,51 +151,80 @@ async def remove_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Try to execute delete by channel_id
     
     target = context.args[0]
-    # Try to find ID if username passed
+    # Usernames are resolved from our own (regularly refreshed) channel rows
     if target.startswith('@'):
-        # This is tricky without fetching from TG. 
-        # But we can search our DB for this username?
-        # Peewee query:
-        # channel = Channel.select().where(Channel.username == target.replace('@', ''))...
-        # Implementation in database.py is needed really.
-        # For now, let's assume user passes ID or we resolve it via API
-        try:
-             chat = await context.bot.get_chat(target)
-             target_id = chat.id
-        except:
-             await update.message.reply_text("❌ valid channel not found.")
+        channel = database.find_channel_by_username(target)
+        if not channel:
+             await update.message.reply_text("❌ No added channel has that username.")
              return
+        target_id = channel.channel_id
     else:
         target_id = target
 
-    if database.remove_channel(target_id):
+    if await database.aio.remove_channel(target_id):
         await update.message.reply_text(f"🗑️ Channel {target} removed.")
     else:
         await update.message.reply_text("⚠️ Channel not found in database.")
 
-async def list_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
+LIST_MESSAGE_LIMIT = 4000
 
+async def list_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
     channels = database.get_channels()
     if not channels:
         await update.message.reply_text("Test: No channels added.")
         return
 
-    text = "📢 *Added Channels:*\n"
+    text = f"📢 *Added Channels ({len(channels)}):*\n"
     for c in channels:
         handle = f"@{c.username}" if c.username else "Private"
-        text += f"- {c.title} ({handle}) `ID: {c.channel_id}`\n"
-    
-    await update.message.reply_text(text, parse_mode='Markdown')
+        warning = " ⚠️ bot not admin" if c.bot_is_admin is False else ""
+        entry = f"- {c.title} ({handle}) `ID: {c.channel_id}`{warning}\n  {_delivery_health(c)}\n"
+        # Split between channels (never inside one) to stay under Telegram's 4096-character limit
+        if len(text) + len(entry) > LIST_MESSAGE_LIMIT:
+            await update.message.reply_text(text, parse_mode='Markdown')
+            text = ""
+        text += entry
 
     await update.message.reply_text(text, parse_mode='Markdown')
 
+def _delivery_health(c):
+    attempts = c.sent_count + c.failed_count
+    if not attempts:
+        return "no deliveries yet"
+    line = f"{c.sent_count}/{attempts} delivered ({c.sent_count / attempts:.0%})"
+    if c.avg_latency_ms is not None:
+        line += f", ~{c.avg_latency_ms:.0f} ms"
+    if health.is_quarantined(c):
+        line = f"⛔ quarantined, next try {c.quarantined_until:%Y-%m-%d %H:%M} · " + line
+    if c.last_error:
+        line += f"\n  last error {c.last_error_at:%Y-%m-%d %H:%M}: `{c.last_error[:80].replace('`', '')}`"
+    return line
+
+async def on_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Someone joined/left one of our channels: keep the membership index current
+    result = update.chat_member
+    channel_id = str(result.chat.id)
+    if any(c.channel_id == channel_id for c in database.get_channels()):
+        member = result.new_chat_member
+        # Telegram's timestamp, in local time like the rest of the table
+        observed_at = result.date.astimezone().replace(tzinfo=None)
+        await database.aio.record_members([(channel_id, member.user.id, member.status, observed_at)])
+
 async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Detect if bot is added to a channel
     result = update.my_chat_member
     new_member = result.new_chat_member
+
+    if any(c.channel_id == str(result.chat.id) for c in database.get_channels()):
+        is_admin = new_member.status in ['administrator', 'creator']
+        fields = {'bot_is_admin': is_admin}
+        if is_admin:
+            # Rights restored: let broadcasts reach it again right away
+            fields.update(database.HEALTHY)
+        await database.aio.save_channel_refresh({result.chat.id: fields})
+        if not is_admin:
+            # No more chat_member updates from here, so the index would go stale
+            await database.aio.forget_channel_members(result.chat.id)
     
     if new_member.status in ['administrator', 'creator'] and result.chat.type == 'channel':
         chat = result.chat
@@ -209,7 +240,7 @@ async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # (chat.invite_link might be None if we are just added).
                 # But we can try matching Title?
                 if c.title == chat.title: # Exact title match
-                     database.update_channel_id(c.channel_id, chat.id, chat.title)
+                     await database.aio.update_channel_id(c.channel_id, chat.id, chat.title)
                      updated = True
                      # Notify owner
                      if config.OWNER_USERNAME:
@@ -226,11 +257,64 @@ async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
                  text=f"🤖 I was added to *{chat.title}*.\n\nID: `{chat.id}`\n\nIf you added this channel via link-only, please remove it and add again with this ID for verification to work."
              )
 
+IMPORT_USAGE = (
+    "Send a .txt or .csv file with /importchannels as its caption (or reply to one with /importchannels).\n"
+    "One channel per line: -100 ID, @username or t.me link. For private channels put the ID and the invite link on one line."
+)
+
+async def import_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    document = message.document or (message.reply_to_message and message.reply_to_message.document)
+    if not document:
+        await message.reply_text(IMPORT_USAGE)
+        return
+    if document.file_size and document.file_size > config.IMPORT_MAX_BYTES:
+        await message.reply_text(f"❌ File too large (max {config.IMPORT_MAX_BYTES // 1024} KB).")
+        return
+
+    file = await document.get_file()
+    text = bytes(await file.download_as_bytearray()).decode('utf-8-sig', errors='replace')
+    entries = importer.parse(text)
+    if not entries:
+        await message.reply_text("❌ No channels found in that file.\n\n" + IMPORT_USAGE)
+        return
+    skipped = len(entries) - config.IMPORT_MAX_LINES
+    entries = entries[:config.IMPORT_MAX_LINES]
+    await message.reply_text(f"⏳ Importing {len(entries)} channels...")
+
+    async def run():
+        try:
+            await importer.import_channels(context.bot, entries)
+        except Exception as e:
+            logger.exception("Channel import failed")
+            await message.reply_text(f"❌ Import failed, no channels were added: {e}")
+            return
+        text = f"📥 Import finished: {importer.summary(entries)}."
+        if skipped > 0:
+            text += f"\n⚠️ Only the first {config.IMPORT_MAX_LINES} lines were read; {skipped} more were ignored."
+        report = "\n".join(e.report() for e in entries)
+        try:
+            if len(text) + len(report) < 3500:
+                await message.reply_text(f"{text}\n\n{report}")
+            else:
+                await message.reply_document(InputFile(report.encode(), filename="import_report.txt"), caption=text)
+        except TelegramError:
+            # The channels are in; at least tell the owner the totals
+            logger.exception("Could not send the import report")
+            await message.reply_text(f"{text}\n(The per-line report could not be sent.)")
+
+    # Resolving hundreds of channels at IMPORT_RATE takes a while; don't hold up the owner's other updates
+    context.application.create_task(run(), update=update)
+
 def get_handlers():
     from telegram.ext import ChatMemberHandler
     return [
-        CommandHandler("addchannel", add_channel),
-        CommandHandler("removechannel", remove_channel),
-        CommandHandler("listchannels", list_channels),
-        ChatMemberHandler(on_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER)
+        CommandHandler("addchannel", add_channel, filters=OWNER),
+        CommandHandler("removechannel", remove_channel, filters=OWNER),
+        CommandHandler("listchannels", list_channels, filters=OWNER),
+        CommandHandler("importchannels", import_channels, filters=OWNER),
+        # The file itself with the command as caption; registered before the broadcast catch-all
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/importchannels(@\w+)?(\s|$)') & OWNER, import_channels),
+        ChatMemberHandler(on_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER),
+        ChatMemberHandler(on_chat_member, ChatMemberHandler.CHAT_MEMBER),
     ]
@@ -2,6 +2,7 @@ from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 import database
 import config
+from auth import OWNER
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -13,7 +14,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Auto-add initial owner if configured and not yet added
     if config.OWNER_USERNAME and username.lower() == config.OWNER_USERNAME:
         if not database.is_owner(username):
-            database.add_owner_safe(username)
+            await database.aio.add_owner_safe(username)
             await update.message.reply_text(f"Welcome Boss! You have been registered as an owner.")
 
     if database.is_owner(username):
@@ -25,37 +26,31 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📢 *Channel Management*\n"
             "/addchannel @channel - Add channel\n"
             "/removechannel @channel - Remove channel\n"
-            "/listchannels - List channels\n\n"
+            "/listchannels - List channels\n"
+            "/importchannels - Add channels from a file\n\n"
             "🔗 *Links*\n"
             "/setclaim <link> - Set Claim Link\n\n"
             "📝 *Posting*\n"
             "Just send a message to broadcast.\n"
-            "/schedule HH:MM <message> - Schedule post",
+            "/schedule HH:MM <message> - Schedule post\n"
+            "/dm all|joined|minpoints N <message> - Message users",
             parse_mode='Markdown'
         )
     else:
         await update.message.reply_text("⛔ Access Denied. You are not an authorized owner.")
 
 async def add_owner(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
-
     if not context.args:
         await update.message.reply_text("Usage: /addowner username")
         return
 
     new_owner = context.args[0]
-    if database.add_owner_safe(new_owner):
+    if await database.aio.add_owner_safe(new_owner):
         await update.message.reply_text(f"✅ Added {new_owner} as owner.")
     else:
         await update.message.reply_text(f"⚠️ Could not add {new_owner}. Already exists?")
 
 async def remove_owner(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
-
     if not context.args:
         await update.message.reply_text("Usage: /removeowner username")
         return
@@ -66,31 +61,23 @@ async def remove_owner(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Cannot remove the primary owner.")
         return
 
-    if database.remove_owner(target):
+    if await database.aio.remove_owner(target):
         await update.message.reply_text(f"🗑️ Removed {target} from owners.")
     else:
         await update.message.reply_text(f"⚠️ {target} not found.")
 
 async def list_owners(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
-
-    owners = database.get_owners()
+    owners = await database.aio.get_owners()
     text = "👑 *OwnersList:*\n" + "\n".join([f"- @{o}" for o in owners])
     await update.message.reply_text(text, parse_mode='Markdown')
 
 async def set_claim_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if not database.is_owner(user.username):
-        return
-
     if not context.args:
         await update.message.reply_text("Usage: /setclaim <new_link>")
         return
 
     new_link = context.args[0]
-    if database.set_setting('claim_link', new_link):
+    if await database.aio.set_setting('claim_link', new_link):
         await update.message.reply_text(f"✅ Claim link updated to:\n{new_link}")
     else:
         await update.message.reply_text("⚠️ Failed to update link.")
@@ -98,8 +85,8 @@ async def set_claim_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def get_handlers():
     return [
         CommandHandler("start", start),
-        CommandHandler("addowner", add_owner),
-        CommandHandler("removeowner", remove_owner),
-        CommandHandler("listowners", list_owners),
-        CommandHandler("setclaim", set_claim_link),
+        CommandHandler("addowner", add_owner, filters=OWNER),
+        CommandHandler("removeowner", remove_owner, filters=OWNER),
+        CommandHandler("listowners", list_owners, filters=OWNER),
+        CommandHandler("setclaim", set_claim_link, filters=OWNER),
     ]
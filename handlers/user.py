@@ -2,6 +2,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, constan
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 from telegram.error import BadRequest
 import database
+import membership
 
 import config
 
@@ -9,62 +10,44 @@ import config
 POINTS_PER_JOIN = 100
 POINTS_PER_REFERRAL = 50
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    args = context.args
-    referrer_id = None
-    
-    # Check for referral code
-    if args and args[0].isdigit():
-        possible_referrer = int(args[0])
-        if possible_referrer != user.id:
-            referrer_id = possible_referrer
-
-    # Add user to DB
-    db_user = database.add_user(user.id, user.username, referrer_id)
-    
-    # Check if owner
-    is_admin = database.is_owner(user.username)
-    
-    # If new user and has referrer, maybe notify referrer or just track it?
-    # For now, we just track it in DB. Points are awarded when they VERIFY.
-
-    text = (
-        f"� *WELCOME BOSS {user.first_name}* 🔥\n\n"
-        "� *EARNING OPPORTUNITY LIVE* 💥\n\n"
-        "📢 *Channels Join Karo*\n"
-        "💸 *Sirf ₹100 Pay Karo*\n\n"
-        "📝 *Register Karo & Instant Bonus Lo*\n"
-        "🎁 *₹350 Bonus Pao* 😍\n\n"
-        "📲 *Payment Screenshot Bhejo*\n"
-        f"📩 *Contact / Support:* @{config.OWNER_USERNAME}\n\n"
-        "⏰ ⚠️ *Offer Limited Time Ke Liye Hai*\n"
-        "🚀 *Late Mat Karo – Abhi Join Karo!*"
-    )
-    
+START_TEXT = (
+    "� *WELCOME BOSS {first_name}* 🔥\n\n"
+    "� *EARNING OPPORTUNITY LIVE* 💥\n\n"
+    "📢 *Channels Join Karo*\n"
+    "💸 *Sirf ₹100 Pay Karo*\n\n"
+    "📝 *Register Karo & Instant Bonus Lo*\n"
+    "🎁 *₹350 Bonus Pao* 😍\n\n"
+    "📲 *Payment Screenshot Bhejo*\n"
+    f"📩 *Contact / Support:* @{config.OWNER_USERNAME}\n\n"
+    "⏰ ⚠️ *Offer Limited Time Ke Liye Hai*\n"
+    "🚀 *Late Mat Karo – Abhi Join Karo!*"
+)
+
+# Prebuilt /start keyboards keyed by is_admin -> (cache_version, markup).
+# Rebuilt only after a channel or setting change bumps database.cache_version().
+_keyboards = {}
+
+def _channel_url(c):
+    # We utilize stored invite_link if available. No API calls here: this
+    # runs on every /start.
+    if getattr(c, 'invite_link', None):
+        return c.invite_link
+    if c.username:
+        return f"https://t.me/{c.username}"
+    if str(c.channel_id).startswith('-100'):
+        return f"https://t.me/c/{str(c.channel_id)[4:]}/1" # Hacky
+    return "https://t.me/"
+
+def _build_start_keyboard(is_admin):
     keyboard = []
     
     # 1. Add Channel Buttons (3 per row)
     channels = database.get_channels()
     if channels:
         row = []
-        for i, c in enumerate(channels):
-            # We utilize stored invite_link if available
-            if getattr(c, 'invite_link', None):
-                 url = c.invite_link
-            elif c.username:
-                 url = f"https://t.me/{c.username}"
-            else:
-                 try:
-                     chat = await context.bot.get_chat(c.channel_id)
-                     url = chat.invite_link or f"https://t.me/c/{str(c.channel_id)[4:]}/1" # Hacky
-                 except:
-                     url = "https://t.me/"
-            
+        for c in channels:
             # User requested "Join Here" text on buttons
-            btn_text = "Join ↗️"
-            
-            row.append(InlineKeyboardButton(btn_text, url=url))
+            row.append(InlineKeyboardButton("Join ↗️", url=_channel_url(c)))
             
             if len(row) == 3:
                 keyboard.append(row)
@@ -74,15 +57,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if row:
             keyboard.append(row)
 
-        # 2. Add Verify Button
-
         # 2. Add Verify Button
         keyboard.append([InlineKeyboardButton("✅ Verify Joined", callback_data="verify_join")])
-    else:
-        text += "\n\n⚠️ *No channels added yet.*"
 
     # 3. Add Claim Here Section
-    text += "\n\n👇 *Claim Here:*"
     claim_link = database.get_setting('claim_link', config.EXTERNAL_LINK)
     keyboard.append([InlineKeyboardButton("🎁 Claim", url=claim_link)])
     
@@ -91,13 +69,49 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         owner_url = f"https://t.me/{config.OWNER_USERNAME}"
         keyboard.append([InlineKeyboardButton("➕ Add Your Channel", url=owner_url)])
     
-    # 4. Other Buttons (None for now)
-    
     if is_admin:
         keyboard.append([InlineKeyboardButton("👑 Owner Panel", callback_data="owner_panel")])
+
+    return InlineKeyboardMarkup(keyboard)
+
+def _start_keyboard(is_admin):
+    version = database.cache_version()
+    cached = _keyboards.get(is_admin)
+    if cached is None or cached[0] != version:
+        cached = _keyboards[is_admin] = (version, _build_start_keyboard(is_admin))
+    return cached[1]
+
+def _start_suffix(db_user):
+    suffix = "" if database.get_channels() else "\n\n⚠️ *No channels added yet.*"
+    if db_user:
+        # Materialized counters come with the user row, no extra query
+        suffix += f"\n\n👥 *Your Referrals:* {db_user.referral_count} invited, {db_user.verified_referral_count} verified"
+    return suffix + "\n\n👇 *Claim Here:*"
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    args = context.args
+    referrer_id = None
+    
+    # Check for referral code
+    if args and args[0].isdigit():
+        possible_referrer = int(args[0])
+        if possible_referrer != user.id:
+            referrer_id = possible_referrer
+
+    # Add user to DB
+    db_user = await database.aio.add_user(user.id, user.username, referrer_id)
+    
+    # Check if owner
+    is_admin = database.is_owner(user.username)
     
+    # If new user and has referrer, maybe notify referrer or just track it?
+    # For now, we just track it in DB. Points are awarded when they VERIFY.
+
+    text = START_TEXT.format(first_name=user.first_name) + _start_suffix(db_user)
+    reply_markup = _start_keyboard(is_admin)
+
     # Reply
-    reply_markup = InlineKeyboardMarkup(keyboard)
     if update.callback_query:
         await update.callback_query.answer()
         try:
@@ -114,52 +128,45 @@ async def start_earning(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def verify_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = query.from_user.id
-    db_user = database.get_user(user_id)
+    db_user = await database.aio.get_user(user_id)
     
     if db_user and db_user.joined_all:
          await query.answer("✅ You have already verified and claimed rewards!", show_alert=True)
          return
 
     channels = database.get_channels()
-    not_joined = []
     
     await query.answer("Checking membership...") # Toast
     
-    for c in channels:
-        # If it's a "Link Only" channel (dummy ID), skip verification (Auto-pass)
-        if str(c.channel_id).startswith('private_'):
-            continue
-
-        try:
-            member = await context.bot.get_chat_member(chat_id=c.channel_id, user_id=user_id)
-            if member.status in ['left', 'kicked', 'restricted']: # restricted might mean banned
-                not_joined.append(c.title)
-        except BadRequest:
-            # Bot might not be admin or channel issue
-            print(f"Error checking {c.title}")
-            not_joined.append(c.title) # Assume not joined if check fails
-
-    if not_joined:
-        text = "❌ *You haven't joined all channels!*\n\nMissing:\n" + "\n".join([f"- {t}" for t in not_joined])
+    missing, unchecked = await membership.find_missing(context.bot, channels, user_id)
+    not_joined = [c.title for c in missing]
+
+    if not_joined or unchecked:
+        if not_joined:
+            text = "❌ *You haven't joined all channels!*\n\nMissing:\n" + "\n".join([f"- {t}" for t in not_joined])
+        else:
+            text = "⏳ *Telegram is busy right now.*"
+        if unchecked:
+            # Timed out or failed: not known to be missing, so don't say so
+            text += "\n\nCouldn't check, please try again:\n" + "\n".join([f"- {c.title}" for c in unchecked])
         await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("🔄 Try Again", callback_data="start_earning")]
         ]))
     else:
-        # Success!
-        database.add_points(user_id, POINTS_PER_JOIN)
-        
-        # Mark as joined_all
-        db_user.joined_all = True
-        db_user.save()
+        # Success! Flag + user credit + referrer credit in one transaction
+        verified, referrer_id = await database.aio.complete_verification(
+            user_id, POINTS_PER_JOIN, POINTS_PER_REFERRAL
+        )
+        if not verified:
+            await query.edit_message_text("✅ You have already verified and claimed rewards!")
+            return
         
-        # Reward Referrer (if any and not already rewarded for this user?)
-        # Logic: If referrer exists, give them points now.
-        if db_user.referrer_id:
-            database.add_points(db_user.referrer_id, POINTS_PER_REFERRAL)
+        # Reward Referrer: credited above, just let them know
+        if referrer_id:
             # Optional: Notify referrer
             try:
                 await context.bot.send_message(
-                    db_user.referrer_id, 
+                    referrer_id, 
                     f"🎉 *Referral Bonus!* A user you invited just verified their account. +{POINTS_PER_REFERRAL} points!",
                     parse_mode='Markdown'
                 )
@@ -193,16 +200,51 @@ async def owner_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📢 *Channel Management*\n"
             "/addchannel <link> - Add channel\n"
             "/removechannel <id> - Remove channel\n"
-            "/listchannels - List channels\n\n"
+            "/listchannels - List channels\n"
+            "/importchannels - Add channels from a file\n\n"
             "📝 *Posting*\n"
             "Just send a message to broadcast.\n"
-            "/schedule HH:MM <message> - Schedule post"
+            "/schedule HH:MM <message> - Schedule post\n"
+            "/dm all|joined|minpoints N <message> - Message users"
     )
     await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Home", callback_data="back_home")]]))
 
+def _display_name(user_id, username):
+    return f"@{username}" if username else f"user {str(user_id)[-4:]}"
+
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Served from the in-memory top-K; no ORDER BY over the user table
+    by_points, by_referrals = await database.aio.get_leaderboards()
+    medals = ["🥇", "🥈", "🥉"]
+
+    def lines(rows, unit):
+        if not rows:
+            return "No entries yet."
+        return "\n".join(
+            f"{medals[i] if i < 3 else f'{i + 1}.'} {_display_name(uid, name)} - {score} {unit}"
+            for i, (uid, score, name) in enumerate(rows)
+        )
+
+    text = (f"🏆 Top Points\n{lines(by_points, 'pts')}\n\n"
+            f"👥 Top Referrers\n{lines(by_referrals, 'invited')}")
+    rank = await database.aio.get_rank(update.effective_user.id)
+    if rank:
+        text += f"\n\nYour rank: #{rank[0]} with {rank[1]} points"
+    # Plain text: usernames may contain Markdown characters
+    await update.message.reply_text(text)
+
+async def my_rank(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rank = await database.aio.get_rank(update.effective_user.id)
+    if not rank:
+        await update.message.reply_text("Send /start first to join the leaderboard.")
+        return
+    await update.message.reply_text(f"🏅 Your rank: #{rank[0]} with {rank[1]} points")
+
 def get_handlers():
     return [
         CommandHandler("start", start),
+        CommandHandler("leaderboard", leaderboard),
+        CommandHandler("rank", my_rank),
         CallbackQueryHandler(start_earning, pattern="^start_earning$"),
         CallbackQueryHandler(verify_join, pattern="^verify_join$"),
         CallbackQueryHandler(back_home, pattern="^back_home$"),
@@ -0,0 +1,65 @@
+"""
+Per-channel delivery health and the dead-channel circuit breaker.
+
+Every broadcast batch reports per-channel outcomes (sends, failures,
+latency, last error) that database.record_deliveries() adds to the Channel
+row. After CHANNEL_QUARANTINE_AFTER deliveries in a row fail with an error
+that means the channel itself is unreachable (kicked, chat not found, no
+post rights), the channel is quarantined: broadcasts skip it until
+quarantined_until. The first broadcast after that time is a probe. If it
+succeeds the channel is healthy again; if not, the next probe is twice as
+far away (up to CHANNEL_PROBE_MAX_SECONDS).
+"""
+import datetime
+
+from telegram.error import BadRequest, Forbidden
+
+# BadRequest texts that blame the channel rather than the payload
+DEAD_CHANNEL_MESSAGES = ('chat not found', 'not enough rights', 'chat_write_forbidden', 'have no rights',
+                         'channel_private', 'need administrator rights')
+
+
+def is_dead_channel_error(error):
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and any(m in error.message.lower() for m in DEAD_CHANNEL_MESSAGES)
+
+
+def is_quarantined(channel, now=None):
+    # A quarantine that has run out lets the next broadcast through as a probe
+    until = getattr(channel, 'quarantined_until', None)
+    return until is not None and until > (now or datetime.datetime.now())
+
+
+class DeliveryStats:
+    """Outcomes of one outbox batch, per channel."""
+
+    def __init__(self):
+        self._stats = {}
+
+    def _entry(self, chat_id):
+        entry = self._stats.get(chat_id)
+        if entry is None:
+            entry = self._stats[chat_id] = {'sent': 0, 'failed': 0, 'seconds': 0.0, 'error': None, 'dead': False}
+        return entry
+
+    def ok(self, chat_id, seconds):
+        entry = self._entry(chat_id)
+        entry['sent'] += 1
+        entry['seconds'] += seconds
+
+    def fail(self, chat_id, error):
+        entry = self._entry(chat_id)
+        entry['failed'] += 1
+        entry['error'] = str(error) or type(error).__name__
+        entry['dead'] = is_dead_channel_error(error)
+
+    def rows(self):
+        """{channel_id: {sent, failed, latency_ms, error, dead}} for database.record_deliveries."""
+        return {
+            chat_id: dict(
+                sent=e['sent'], failed=e['failed'], error=e['error'], dead=e['dead'],
+                latency_ms=e['seconds'] / e['sent'] * 1000 if e['sent'] else None,
+            )
+            for chat_id, e in self._stats.items()
+        }
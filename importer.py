@@ -0,0 +1,166 @@
+"""
+Bulk channel import from a text/CSV file (/importchannels).
+
+Every non-empty line names one channel by ID (-100...), @username or
+t.me link; in CSV files the first cell that looks like one of those is used,
+and an ID plus a link on the same line is taken as "<id> <invite link>", as
+with /addchannel. Lines are resolved concurrently (IMPORT_CONCURRENCY at a
+time, at most IMPORT_RATE Bot API calls a second) with get_chat and
+get_chat_member(bot). Channels where the bot is admin are inserted in one
+transaction; every line gets an outcome: added, duplicate, not-admin or
+unresolvable.
+"""
+import asyncio
+import csv
+import logging
+import re
+
+from telegram.error import TelegramError
+
+import config
+import database
+import transport
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+ADDED, DUPLICATE, NOT_ADMIN, UNRESOLVABLE = 'added', 'duplicate', 'not-admin', 'unresolvable'
+OUTCOMES = (ADDED, DUPLICATE, NOT_ADMIN, UNRESOLVABLE)
+
+_ID = re.compile(r'^-?\d{5,}$')
+_USERNAME = re.compile(r'^@?([A-Za-z][A-Za-z0-9_]{3,31})$')
+_LINK = re.compile(r'^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(.+)$', re.IGNORECASE)
+
+
+class Entry:
+    def __init__(self, line_no, raw, target=None, invite_link=None):
+        self.line_no = line_no
+        self.raw = raw
+        self.target = target  # chat id or @username passed to get_chat
+        self.invite_link = invite_link
+        self.outcome = None
+        self.detail = ''
+        self.row = None  # add_channels() row once resolved
+
+    def report(self):
+        detail = f" ({self.detail})" if self.detail else ""
+        return f"{self.line_no}: {self.raw[:60]} -> {self.outcome}{detail}"
+
+
+def _private_link(path):
+    return path.startswith('+') or path.startswith('joinchat/')
+
+
+def parse_entry(line_no, raw):
+    cells = [c.strip() for c in next(csv.reader([raw.replace(';', ',').replace('\t', ',')]), [])]
+    cells = [w for c in cells for w in c.split()]
+    channel_id = username = link = None
+    for cell in cells:
+        match = _LINK.match(cell)
+        if match and not link:
+            path = match.group(1)
+            if _private_link(path):
+                link = cell if cell.lower().startswith('http') else f"https://{cell}"
+            else:
+                # t.me/name, t.me/name/123 (a post) and t.me/s/name (web preview)
+                # all name the channel; link to the channel itself
+                if path.lower().startswith('s/'):
+                    path = path[2:]
+                name = _USERNAME.match(path.split('/')[0].split('?')[0])
+                if name:
+                    link = f"https://t.me/{name.group(1)}"
+                    username = username or f"@{name.group(1)}"
+        elif _ID.match(cell) and not channel_id:
+            channel_id = cell
+        elif cell.startswith('@') and _USERNAME.match(cell) and not username:
+            username = cell
+
+    entry = Entry(line_no, raw, channel_id or username, link)
+    if entry.target is None:
+        entry.outcome = UNRESOLVABLE
+        entry.detail = "private invite link needs the channel ID" if link else "no ID, @username or t.me link"
+    return entry
+
+
+def parse(text):
+    """Entries for every non-empty, non-comment line (header rows are reported as unresolvable)."""
+    entries = []
+    for line_no, raw in enumerate(text.splitlines(), 1):
+        raw = raw.strip()
+        if raw and not raw.startswith('#'):
+            entries.append(parse_entry(line_no, raw))
+    return entries
+
+
+async def _resolve(bot, entry, bucket):
+    try:
+        await bucket.acquire()
+        chat = await bot.get_chat(entry.target)
+        if chat.type != 'channel':
+            entry.outcome, entry.detail = UNRESOLVABLE, f"not a channel ({chat.type})"
+            return
+        await bucket.acquire()
+        member = await chat.get_member(bot.id)
+    except TelegramError as e:
+        entry.outcome, entry.detail = UNRESOLVABLE, str(e)
+        return
+
+    if member.status not in ('administrator', 'creator'):
+        entry.outcome, entry.detail = NOT_ADMIN, chat.title
+        return
+    link = entry.invite_link or (f"https://t.me/{chat.username}" if chat.username else chat.invite_link)
+    entry.row = {'channel_id': str(chat.id), 'title': chat.title, 'username': chat.username,
+                 'invite_link': link or "https://t.me/", 'bot_is_admin': True}
+
+
+async def import_channels(bot, entries):
+    """Resolve and add the channels of parse()d `entries`, setting each entry's outcome."""
+    bot = transport.bulk_bot or bot
+    # IDs and lowercased usernames already in the DB or earlier in the file
+    seen = {c.channel_id for c in database.get_channels()}
+    seen |= {c.username.lstrip('@').lower() for c in database.get_channels() if c.username}
+
+    todo = []
+    for entry in entries:
+        if entry.outcome:
+            continue
+        target = entry.target.lstrip('@').lower()
+        if target in seen:
+            entry.outcome = DUPLICATE
+        else:
+            seen.add(target)
+            todo.append(entry)
+
+    sem = asyncio.Semaphore(config.IMPORT_CONCURRENCY)
+    bucket = TokenBucket(config.IMPORT_RATE)
+
+    async def resolve(entry):
+        async with sem:
+            await _resolve(bot, entry, bucket)
+
+    await asyncio.gather(*(resolve(e) for e in todo))
+
+    # Lines naming the same channel (ID on one, username on another) count once
+    rows = {}
+    for entry in todo:
+        if entry.row is None:
+            continue
+        if entry.row['channel_id'] in rows:
+            entry.outcome = DUPLICATE
+        else:
+            rows[entry.row['channel_id']] = entry.row
+    added = await database.aio.add_channels(list(rows.values()))
+    for entry in todo:
+        if entry.outcome is None:
+            entry.outcome = ADDED if entry.row['channel_id'] in added else DUPLICATE
+            entry.detail = entry.row['title']
+
+    logger.info("Channel import: %d lines, %d added", len(entries), len(added))
+    return entries
+
+
+def summary(entries):
+    counts = {outcome: 0 for outcome in OUTCOMES}
+    for entry in entries:
+        counts[entry.outcome] += 1
+    return ", ".join(f"{n} {outcome}" for outcome, n in counts.items())
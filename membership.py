@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+import logging
+
+from telegram.error import TelegramError
+
+import config
+import database
+import metrics
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+NOT_JOINED = ('left', 'kicked', 'restricted')  # restricted might mean banned
+
+# (channel_id, user_id) -> True for recent positive checks only, so a
+# "Try Again" re-checks just the channels that failed last time
+_joined = TTLCache(config.MEMBERSHIP_CACHE_TTL)
+
+# (user_id, channel ids, fail_fast) -> task of the check currently running for it
+_in_flight = {}
+
+
+async def _member_status(bot, channel, user_id):
+    # None when the check itself failed. VERIFY_TIMEOUT includes the wait for
+    # a free interactive connection, so a busy pool ends up here too
+    try:
+        member = await asyncio.wait_for(
+            bot.get_chat_member(chat_id=channel.channel_id, user_id=user_id),
+            timeout=config.VERIFY_TIMEOUT
+        )
+    except (TelegramError, asyncio.TimeoutError) as e:
+        # Bot might not be admin, channel issue or Telegram is slow
+        logger.warning("Error checking %s: %s", channel.title, e)
+        return None
+    return member.status
+
+
+async def find_missing(bot, channels, user_id, fail_fast=None):
+    """
+    Return (missing, unchecked): the channels `user_id` has not joined and
+    the ones that could not be checked (API error or timeout), in channel
+    order. An unchecked channel is not known to be missing, so callers
+    should ask the user to retry rather than report it as not joined.
+
+    Single-flight per user: a call made while an identical check for the
+    same user is running waits for that check and gets its result, instead
+    of repeating the index query and get_chat_member calls.
+    """
+    if fail_fast is None:
+        fail_fast = config.VERIFY_FAIL_FAST
+    key = (user_id, tuple(c.channel_id for c in channels), fail_fast)
+    task = _in_flight.get(key)
+    if task is None:
+        task = _in_flight[key] = asyncio.ensure_future(_find_missing(bot, channels, user_id, fail_fast))
+        task.add_done_callback(lambda t: _in_flight.pop(key, None))
+    else:
+        metrics.MEMBERSHIP_CHECKS.inc('shared', amount=len(channels))
+    # Shielded: one caller giving up must not cancel the check for the others
+    missing, unchecked = await asyncio.shield(task)
+    return list(missing), list(unchecked)
+
+
+async def _find_missing(bot, channels, user_id, fail_fast):
+    """
+    The uncoalesced check behind find_missing.
+
+    Answers come from the positive cache, then the local membership index
+    (one query). Only positive index rows are trusted: channels where the
+    index says "not joined", or knows nothing, are asked via get_chat_member,
+    so a user who joined since is never locked out by a stale row. Those
+    checks run concurrently (capped by VERIFY_CONCURRENCY) and positive
+    answers are added to the index. With `fail_fast` the result stops at the
+    first missing channel found.
+    """
+    # Link-only channels (dummy ID) can't be verified: auto-pass
+    pending = [
+        c for c in channels
+        if not str(c.channel_id).startswith('private_') and (c.channel_id, user_id) not in _joined
+    ]
+    metrics.MEMBERSHIP_CHECKS.inc('cache', amount=len(channels) - len(pending))
+    if not pending:
+        return [], []
+
+    known = await database.aio.get_member_statuses(user_id, [c.channel_id for c in pending])
+    unknown = []
+    for c in pending:
+        status = known.get(c.channel_id)
+        if status is None or status in NOT_JOINED:
+            unknown.append(c)
+        else:
+            _joined.set((c.channel_id, user_id), True)
+    metrics.MEMBERSHIP_CHECKS.inc('index', amount=len(pending) - len(unknown))
+
+    missing, unchecked = await _check_api(bot, unknown, user_id, fail_fast) if unknown else (set(), set())
+
+    result = [c for c in pending if c.channel_id in missing]
+    return (result[:1] if fail_fast else result), [c for c in pending if c.channel_id in unchecked]
+
+
+async def _check_api(bot, channels, user_id, fail_fast):
+    sem = asyncio.Semaphore(config.VERIFY_CONCURRENCY)
+
+    async def check(channel):
+        async with sem:
+            # Stamped with the time of asking, so a chat_member update that
+            # arrives while the call is in flight wins in the index
+            asked_at = datetime.datetime.now()
+            status = await _member_status(bot, channel, user_id)
+        if status is not None and status not in NOT_JOINED:
+            _joined.set((channel.channel_id, user_id), True)
+        return channel, status, asked_at
+
+    metrics.MEMBERSHIP_CHECKS.inc('api', amount=len(channels))
+    tasks = [asyncio.create_task(check(c)) for c in channels]
+    missing, unchecked = set(), set()
+    learned = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            channel, status, asked_at = await next_done
+            if status is None:
+                unchecked.add(channel.channel_id)
+            elif status in NOT_JOINED:
+                # Not indexed: it is asked again next time
+                missing.add(channel.channel_id)
+                if fail_fast:
+                    break
+            else:
+                learned.append((channel.channel_id, user_id, status, asked_at))
+    finally:
+        for t in tasks:
+            t.cancel()
+
+    await database.aio.record_members(learned)
+    return missing, unchecked
@@ -0,0 +1,192 @@
+"""
+Tiny in-process Prometheus metrics (counters, gauges, histograms) rendered in
+the text exposition format on GET /metrics. Kept dependency-free on purpose:
+the bot only needs a handful of series.
+"""
+import bisect
+import functools
+import time
+
+from telegram.ext import ApplicationHandlerStop
+
+_registry = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self._header()
+        if not self.labelnames and not self._values:
+            lines.append(f'{self.name} 0')
+        for labels, v in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {v}')
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._function = None
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set_function(self, function):
+        # Sampled at scrape time, for values that are cheap to read on demand
+        self._function = function
+
+    def render(self):
+        lines = self._header()
+        if self._function is not None:
+            self._values[()] = self._function()
+        for labels, v in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {v}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * len(self.buckets), 0, 0.0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            state[0][i] += 1
+        state[1] += 1
+        state[2] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = self._header()
+        for labels, (counts, count, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Bot metrics ---
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Handler callback latency', ['handler'])
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Handler callbacks that raised', ['handler'])
+UPDATE_QUEUE_DEPTH = Gauge('bot_update_queue_depth', 'Updates received but not started (queued or waiting for a free slot)')
+UPDATES_WAITING_ON_USER = Gauge('bot_updates_waiting_on_user', 'Updates held behind an earlier one from the same user')
+THROTTLED = Counter('bot_throttled_total', 'Updates dropped by the per-user throttle, by action', ['action'])
+BROADCAST_SENDS = Counter('bot_broadcast_sends_total', 'Messages delivered by the fan-out engine')
+BROADCAST_FAILURES = Counter('bot_broadcast_failures_total', 'Fan-out deliveries given up, by error type', ['error'])
+BROADCAST_RETRIES = Counter('bot_broadcast_retries_total', 'Fan-out retries, by error type', ['error'])
+DB_SECONDS = Histogram(
+    'bot_db_seconds', 'DB helper latency including wait for the DB thread', ['op'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+MEMBERSHIP_CHECKS = Counter(
+    'bot_membership_checks_total', 'Channel membership answers, by source (cache, index, api, shared)', ['source']
+)
+HTTP_SECONDS = Histogram('bot_http_request_seconds', 'Bot API request latency, by connection pool', ['pool'])
+HTTP_POOL_WAIT = Histogram(
+    'bot_http_pool_wait_seconds', 'Time spent waiting for a free connection, by pool', ['pool'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+HTTP_IN_FLIGHT = Gauge('bot_http_in_flight', 'Bot API requests in flight, by connection pool', ['pool'])
+HTTP_POOL_TIMEOUTS = Counter('bot_http_pool_timeouts_total', 'Requests that gave up waiting for a connection', ['pool'])
+SCHEDULE_LAG = Histogram(
+    'bot_schedule_fire_lag_seconds', 'Delay between a scheduled post being due and firing (excluding stagger)',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+JOBQUEUE_LAG = Histogram(
+    'bot_jobqueue_lag_seconds', 'How late JobQueue runs the heartbeat job',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+
+def instrument(handler):
+    """Wrap a PTB handler's callback so its latency and errors are recorded."""
+    callback = handler.callback
+    name = f"{callback.__module__}.{callback.__name__}"
+
+    @functools.wraps(callback)
+    async def timed(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+
+    handler.callback = timed
+    return handler
@@ -0,0 +1,85 @@
+"""
+Concurrent update processing that keeps each user's updates in order.
+
+With concurrent_updates on, PTB runs updates as independent tasks, so a
+user's "Verify Joined" tap could be handled before the /start that preceded
+it. OrderedApplication keys every update by user (or chat, for updates
+without a user). While an update for a key is in flight, later updates for
+the same key are parked in a per-key queue and run by that same task, in
+arrival order. Unrelated users still run in parallel, up to
+CONCURRENT_UPDATES at a time, and a busy user occupies at most one slot.
+
+PTB takes every update off update_queue as soon as it arrives and parks it
+on the concurrency semaphore, so the queue itself is nearly always empty;
+pending_updates() also counts the updates waiting there for a slot.
+"""
+import asyncio
+import collections
+import logging
+
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update):
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return ('user', user.id)
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return ('chat', chat.id)
+    return None
+
+
+class _CountingSemaphore(asyncio.BoundedSemaphore):
+    def __init__(self, value):
+        super().__init__(value)
+        self.waiting = 0  # acquire() calls not yet granted
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            return await super().acquire()
+        finally:
+            self.waiting -= 1
+
+
+class OrderedApplication(Application):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._waiting = {}  # key -> deque of updates queued behind the one in flight
+        # The semaphore PTB (pinned to 20.0) wraps around every process_update call
+        self._concurrent_updates_sem = _CountingSemaphore(self.concurrent_updates or 1)
+
+    def waiting_updates(self):
+        return sum(len(q) for q in self._waiting.values())
+
+    def pending_updates(self):
+        """Updates received but not started: still queued or waiting for a free slot."""
+        return self.update_queue.qsize() + self._concurrent_updates_sem.waiting
+
+    async def process_update(self, update):
+        key = update_key(update) if self.concurrent_updates else None
+        if key is None:
+            return await super().process_update(update)
+
+        queue = self._waiting.get(key)
+        if queue is not None:
+            # The task already handling this user runs it next; our slot is freed now
+            queue.append(update)
+            return
+
+        queue = self._waiting[key] = collections.deque()
+        try:
+            while True:
+                try:
+                    await super().process_update(update)
+                except Exception:
+                    # Don't let one failure drop the updates queued behind it
+                    logger.exception("Error processing update for %s", key)
+                if not queue:
+                    break
+                update = queue.popleft()
+        finally:
+            del self._waiting[key]
@@ -0,0 +1,138 @@
+"""
+Durable broadcast outbox.
+
+A broadcast is written to the DB as one OutboxItem row per channel before
+anything is sent. The dispatcher claims pending rows in batches, fans them out
+through the shared rate-limited engine and marks each row 'sent' as soon as
+Telegram accepts it. After a restart, resume() drains every unfinished
+broadcast from where it stopped, so channels that already got the post are
+never sent it again. Only rows that were in flight at the moment of a crash
+(at most BROADCAST_CONCURRENCY per broadcast) may be delivered twice.
+"""
+import datetime
+import json
+import logging
+import time
+
+from telegram import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo, MessageEntity
+
+import config
+import database
+import fanout
+import health
+import transport
+
+logger = logging.getLogger(__name__)
+
+
+INPUT_MEDIA = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio,
+}
+
+
+def _input_media(item, bot):
+    return INPUT_MEDIA[item['type']](
+        media=item['media'],
+        caption=item.get('caption'),
+        caption_entities=MessageEntity.de_list(item.get('caption_entities'), bot),
+    )
+
+
+async def deliver(bot, chat_id, data):
+    # Deliver a stored post payload ({type: copy|text|album, ...}) to one chat
+    if data['type'] == 'copy':
+        await bot.copy_message(
+            chat_id=chat_id,
+            from_chat_id=data['from_chat_id'],
+            message_id=data['message_id']
+        )
+    elif data['type'] == 'text':
+        await bot.send_message(chat_id=chat_id, text=data['text'])
+    elif data['type'] == 'album':
+        # The whole album in one call, so it stays grouped in the channel
+        await bot.send_media_group(chat_id=chat_id, media=[_input_media(m, bot) for m in data['media']])
+
+
+def target_channels():
+    # Link-only private_ channels can't receive posts; quarantined ones are skipped
+    channels = [c for c in database.get_channels() if not str(c.channel_id).startswith('private_')]
+    now = datetime.datetime.now()
+    live = [c for c in channels if not health.is_quarantined(c, now)]
+    return live, len(channels) - len(live)
+
+
+def target_channel_ids():
+    return [c.channel_id for c in target_channels()[0]]
+
+
+async def submit(bot, data, source='live', consume_schedule=None):
+    """
+    Persist a broadcast to every channel, deliver it and return {status: count}.
+    `consume_schedule` is a one-shot schedule id handed over to the outbox
+    (see database.create_broadcast); {} if it was already consumed.
+    """
+    channels, quarantined = target_channels()
+    broadcast_id = await database.aio.create_broadcast(
+        data, [c.channel_id for c in channels], source, consume_schedule
+    )
+    if broadcast_id is None:
+        return {}
+    counts = await drain(bot, broadcast_id, data)
+    if quarantined:
+        counts['quarantined'] = quarantined
+    return counts
+
+
+async def drain(bot, broadcast_id, data=None):
+    # Bulk sends get their own connection pool so they can't starve user replies
+    bot = transport.bulk_bot or bot
+    if data is None:
+        broadcast = await database.aio.get_broadcast(broadcast_id)
+        data = json.loads(broadcast.payload)
+
+    while True:
+        batch = await database.aio.claim_outbox_batch(broadcast_id, config.OUTBOX_BATCH_SIZE)
+        if not batch:
+            break
+        item_ids = {channel_id: item_id for item_id, channel_id in batch}
+        stats = health.DeliveryStats()
+        unmarked = []
+
+        async def send(chat_id):
+            start = time.perf_counter()
+            await deliver(bot, chat_id, data)
+            stats.ok(chat_id, time.perf_counter() - start)
+            # Committed per message so a crash can't cause a re-send of this one
+            try:
+                await database.aio.mark_outbox_sent(item_ids[chat_id])
+            except Exception:
+                # Delivered already: a DB hiccup must not fail the send; retried below
+                logger.exception("Could not mark outbox item %s sent", item_ids[chat_id])
+                unmarked.append(item_ids[chat_id])
+
+        result = await fanout.engine.run(list(item_ids), send)
+        if unmarked:
+            # If this fails too the rows stay 'sending' and are re-sent on resume
+            await database.aio.mark_outbox_sent(*unmarked)
+        for chat_id, e in result.failed.items():
+            logger.warning("Broadcast %s failed for %s: %s", broadcast_id, chat_id, e)
+            stats.fail(chat_id, e)
+        if result.failed:
+            await database.aio.mark_outbox_failed({item_ids[c]: str(e) for c, e in result.failed.items()})
+        for channel in await database.aio.record_deliveries(stats.rows()):
+            logger.warning("Channel %s (%s) quarantined after repeated failures: %s",
+                           channel.title, channel.channel_id, channel.last_error)
+
+    return await database.aio.finish_broadcast(broadcast_id)
+
+
+async def resume(bot):
+    """Finish broadcasts interrupted by a restart. Call once at startup."""
+    await database.aio.requeue_inflight_outbox()
+    for broadcast in await database.aio.get_unfinished_broadcasts():
+        counts = await drain(bot, broadcast.id, json.loads(broadcast.payload))
+        logger.info("Resumed broadcast %s: %s", broadcast.id, counts)
+    await database.aio.prune_broadcasts(config.OUTBOX_RETENTION_DAYS)
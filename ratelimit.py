@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    @property
+    def full(self):
+        self._refill()
+        return self._tokens >= self.capacity and self._paused_until <= self._updated
+
+    def pause(self, seconds):
+        # Used on flood-control answers: nobody gets a token until the pause expires
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def try_acquire(self, tokens=1):
+        now = self._refill()
+        if now < self._paused_until or self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = self._refill()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
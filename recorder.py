@@ -0,0 +1,58 @@
+"""
+Record incoming updates for offline replay and profiling (tools/replay.py).
+
+Each update is appended to a gzip JSONL file as {"t": <unix time>,
+"update": <update dict>} before any handler sees it. The file is flushed
+every few updates, so a crash loses at most that many, and read()
+tolerates the truncated tail such a crash leaves behind.
+"""
+import gzip
+import json
+import logging
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateRecorder:
+    def __init__(self, path, flush_every=20):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self._file = None
+        self._unflushed = 0
+
+    async def record(self, update, context):
+        # TypeHandler callback; never raises into update processing
+        try:
+            if self._file is None:
+                # Appending starts a new gzip member; gzip readers treat them as one stream
+                self._file = gzip.open(self.path, 'at', encoding='utf-8')
+                logger.info("Recording updates to %s", self.path)
+            line = json.dumps({'t': time.time(), 'update': update.to_dict()}, separators=(',', ':'))
+            self._file.write(line + '\n')
+            self.count += 1
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._file.flush()
+                self._unflushed = 0
+        except Exception as e:
+            logger.warning("Could not record update: %s", e)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read(path):
+    """Yield the recorded {"t", "update"} entries in order."""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, zlib.error, json.JSONDecodeError):
+            # Unclean shutdown: keep everything up to the last complete line
+            logger.warning("%s ends in a truncated record, stopping there", path)
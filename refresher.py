@@ -0,0 +1,99 @@
+"""
+Background refresh of channel metadata and the bot's admin status.
+
+Every CHANNEL_REFRESH_INTERVAL seconds each verifiable channel is looked up
+with get_chat plus get_chat_member(bot) (at most CHANNEL_REFRESH_CONCURRENCY
+channels at a time). Title, username, invite link and bot_is_admin are stored
+on the Channel row, so user-facing paths never need to ask Telegram. Owners
+are told when the bot loses admin rights in a channel, because verification
+and broadcasts to it will fail until the rights are restored.
+"""
+import asyncio
+import logging
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+import config
+import database
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ('administrator', 'creator')
+
+
+def _placeholder_link(link):
+    return not link or link.rstrip('/') == 'https://t.me'
+
+
+async def _fetch(bot, channel):
+    """{field: value} changes for one channel, or None to leave it untouched."""
+    try:
+        chat = await bot.get_chat(channel.channel_id)
+        member = await chat.get_member(bot.id)
+    except (Forbidden, BadRequest) as e:
+        # Kicked, channel deleted or not visible to the bot any more
+        logger.info("Channel %s (%s) not accessible: %s", channel.title, channel.channel_id, e)
+        return {'bot_is_admin': False}
+    except TelegramError as e:
+        # Transient: try again next round
+        logger.warning("Could not refresh %s: %s", channel.title, e)
+        return None
+
+    fields = {'title': chat.title, 'bot_is_admin': member.status in ADMIN_STATUSES}
+    if chat.username:
+        fields['username'] = chat.username
+    # Keep owner-supplied invite links; fill in missing or username-derived ones
+    old_public = f"https://t.me/{channel.username.lstrip('@')}" if channel.username else None
+    if _placeholder_link(channel.invite_link) or channel.invite_link == old_public:
+        if chat.username:
+            fields['invite_link'] = f"https://t.me/{chat.username}"
+        elif chat.invite_link:
+            fields['invite_link'] = chat.invite_link
+    return fields
+
+
+async def refresh_channels(bot):
+    """Refresh every channel; returns the channels where the bot just lost admin."""
+    channels = [c for c in database.get_channels() if not str(c.channel_id).startswith('private_')]
+    sem = asyncio.Semaphore(config.CHANNEL_REFRESH_CONCURRENCY)
+
+    async def refresh(channel):
+        async with sem:
+            return channel, await _fetch(bot, channel)
+
+    results = {}
+    lost = []
+    for channel, fields in await asyncio.gather(*(refresh(c) for c in channels)):
+        if fields is None:
+            continue
+        if channel.bot_is_admin is False and fields['bot_is_admin']:
+            # Made admin again while no my_chat_member update reached us
+            fields.update(database.HEALTHY)
+        results[channel.channel_id] = fields
+        # True -> False, or first check (None) coming back False
+        if channel.bot_is_admin is not False and not fields['bot_is_admin']:
+            lost.append(channel)
+
+    await database.aio.save_channel_refresh(results)
+    for channel in lost:
+        # No chat_member updates come from there now, so its membership index goes stale
+        await database.aio.forget_channel_members(channel.channel_id)
+    logger.info("Refreshed %d channels, %d without admin rights", len(results), len(lost))
+    return lost
+
+
+async def notify_owners(bot, lost):
+    if not lost:
+        return
+    text = "⚠️ I'm no longer an admin in:\n" + "\n".join(f"- {c.title} ({c.channel_id})" for c in lost)
+    text += "\n\nVerification and broadcasts for these channels will fail until I'm made admin again."
+    for user_id in await database.aio.get_owner_user_ids():
+        try:
+            await bot.send_message(user_id, text)
+        except TelegramError as e:
+            logger.warning("Could not notify owner %s: %s", user_id, e)
+
+
+async def refresh_job(context):
+    lost = await refresh_channels(context.bot)
+    await notify_owners(context.bot, lost)
@@ -0,0 +1,274 @@
+"""
+Scheduled posts, driven by one asyncio task over a min-heap of next fire times.
+
+A schedule's spec lives in ScheduledPost.schedule_time:
+
+    HH:MM                       daily at that time (the original format)
+    cron:<m> <h> <dom> <mon> <dow>  five-field cron expression
+    once:YYYY-MM-DD HH:MM       one-shot; the row is deleted when it fires
+
+Times are wall-clock times in config.TIMEZONE. Specs and payloads are parsed
+once when loaded, and /schedule and /deleteschedule update the heap in place.
+Posts due in the same minute are spaced SCHEDULE_STAGGER_SECONDS apart so
+they don't hit the rate limit together.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import time
+from zoneinfo import ZoneInfo
+
+import config
+import database
+import metrics
+import outbox
+
+logger = logging.getLogger(__name__)
+
+TZ = ZoneInfo(config.TIMEZONE)
+
+
+class CronSpec:
+    """Five-field cron expression: minute hour day-of-month month day-of-week."""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError("cron needs 5 fields: minute hour day month weekday")
+        self.expr = ' '.join(fields)
+        parsed = [self._parse(f, lo, hi, i == 4) for i, (f, (lo, hi)) in enumerate(zip(fields, self.RANGES))]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        # Classic cron rule: if both day fields are restricted, either may match
+        self._dom_any = fields[2] == '*'
+        self._dow_any = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, lo, hi, weekday):
+        top = 7 if weekday else hi  # weekday also accepts 7 for Sunday
+        values = set()
+        for part in field.split(','):
+            rng, _, step = part.partition('/')
+            step = int(step) if step else 1
+            if rng == '*':
+                start, end = lo, hi
+            elif '-' in rng:
+                start, end = map(int, rng.split('-'))
+            else:
+                start = int(rng)
+                end = top if step > 1 else start
+            if not (lo <= start <= end <= top) or step < 1:
+                raise ValueError(f"bad cron field: {field}")
+            values.update(v % 7 if weekday else v for v in range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, d):
+        dom = d.day in self.days
+        dow = (d.isoweekday() % 7) in self.weekdays  # cron: 0 = Sunday
+        if self._dom_any or self._dow_any:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, moment):
+        """Next matching local wall time strictly after `moment` (aware datetime)."""
+        local = moment.astimezone(TZ).replace(tzinfo=None, second=0, microsecond=0)
+        t = local + datetime.timedelta(minutes=1)
+        limit = t + datetime.timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+                continue
+            if t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            if t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+                continue
+            return t.replace(tzinfo=TZ)
+        return None
+
+
+class Schedule:
+    def __init__(self, post_id, spec, data):
+        self.id = post_id
+        self.spec = spec
+        self.data = data
+        self.once_at = None
+        self.cron = None
+        if spec.startswith('once:'):
+            self.once_at = datetime.datetime.strptime(spec[5:].strip(), "%Y-%m-%d %H:%M").replace(tzinfo=TZ)
+        elif spec.startswith('cron:'):
+            self.cron = CronSpec(spec[5:])
+        else:
+            h, m = map(int, spec.split(':'))
+            self.cron = CronSpec(f"{m} {h} * * *")
+
+    @property
+    def one_shot(self):
+        return self.once_at is not None
+
+    def next_fire(self, after):
+        if self.one_shot:
+            return self.once_at if self.once_at > after else None
+        return self.cron.next_after(after)
+
+    def describe(self):
+        if self.one_shot:
+            return f"once {self.once_at:%Y-%m-%d %H:%M}"
+        if self.spec.startswith('cron:'):
+            return f"cron {self.cron.expr}"
+        return f"daily {self.spec}"
+
+
+def parse_command(args):
+    """
+    Split /schedule arguments into (spec, remaining args). Accepts
+    `HH:MM ...`, `cron m h dom mon dow ...` and `once YYYY-MM-DD HH:MM ...`.
+    Raises ValueError with a user-facing message.
+    """
+    if not args:
+        raise ValueError("missing time")
+    kind = args[0].lower()
+    if kind == 'cron':
+        if len(args) < 6:
+            raise ValueError("cron needs 5 fields: minute hour day month weekday")
+        spec, rest = 'cron:' + ' '.join(args[1:6]), args[6:]
+    elif kind == 'once':
+        if len(args) < 3:
+            raise ValueError("use: once YYYY-MM-DD HH:MM")
+        spec, rest = f"once:{args[1]} {args[2]}", args[3:]
+    else:
+        datetime.datetime.strptime(args[0], "%H:%M")
+        spec, rest = args[0], args[1:]
+    schedule = Schedule(None, spec, None)  # validates the spec
+    now = datetime.datetime.now(TZ)
+    if schedule.one_shot and schedule.once_at <= now:
+        raise ValueError("that time is in the past")
+    if schedule.next_fire(now) is None:
+        # e.g. cron 0 0 31 2 *
+        raise ValueError("that schedule never fires")
+    return spec, rest
+
+
+class ScheduleDispatcher:
+    def __init__(self):
+        self._heap = []  # (fire timestamp, seq, schedule id)
+        self._schedules = {}  # id -> (Schedule, fire timestamp)
+        self._seq = itertools.count()
+        self._minute_slots = {}  # minute timestamp -> posts already fired in it
+        self._wakeup = asyncio.Event()
+        self._application = None
+        self._task = None
+        self._running = False
+
+    def _push(self, schedule, after):
+        fire = schedule.next_fire(after)
+        if fire is None:
+            self._schedules.pop(schedule.id, None)
+            return
+        self._push_at(schedule, fire.timestamp())
+
+    def _push_at(self, schedule, ts):
+        self._schedules[schedule.id] = (schedule, ts)
+        heapq.heappush(self._heap, (ts, next(self._seq), schedule.id))
+
+    def add(self, post):
+        """Register (or replace) a ScheduledPost row."""
+        try:
+            schedule = Schedule(post.id, post.schedule_time, json.loads(post.message_data))
+        except (ValueError, TypeError) as e:
+            logger.warning("Skipping schedule %s (%s): %s", post.id, post.schedule_time, e)
+            return None
+        now = datetime.datetime.now(TZ)
+        if schedule.one_shot and schedule.once_at <= now:
+            # Missed while the bot was down: send it now rather than never
+            self._push_at(schedule, now.timestamp())
+        else:
+            self._push(schedule, now)
+        self._wakeup.set()
+        return schedule
+
+    def remove(self, schedule_id):
+        # Heap entries of removed schedules are skipped lazily when they surface
+        removed = self._schedules.pop(int(schedule_id), None) is not None
+        self._wakeup.set()
+        return removed
+
+    def next_run(self, schedule_id):
+        entry = self._schedules.get(int(schedule_id))
+        return datetime.datetime.fromtimestamp(entry[1], TZ) if entry else None
+
+    def get(self, schedule_id):
+        entry = self._schedules.get(int(schedule_id))
+        return entry[0] if entry else None
+
+    async def start(self, application):
+        self._application = application
+        for post in await database.aio.get_all_schedules():
+            self.add(post)
+        self._running = True
+        self._task = application.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # The flag covers a cancel that lands while wait_for is returning
+            # (3.11's wait_for can swallow it), so the loop still exits
+            self._running = False
+            self._wakeup.set()
+            self._task.cancel()
+            self._task = None
+
+    def _stagger(self, ts):
+        minute = int(ts // 60) * 60
+        n = self._minute_slots.get(minute, 0)
+        self._minute_slots[minute] = n + 1
+        for old in [m for m in self._minute_slots if m < minute - 120]:
+            del self._minute_slots[old]
+        return n * config.SCHEDULE_STAGGER_SECONDS
+
+    async def _run(self):
+        while self._running:
+            # Drop heap entries whose schedule was removed or rescheduled
+            while self._heap and self._schedules.get(self._heap[0][2], (None, None))[1] != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else 3600
+            if delay > 0:
+                # Capped so wall-clock jumps (DST, NTP) are noticed within a minute
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, 60))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            ts, _, schedule_id = heapq.heappop(self._heap)
+            schedule, _ = self._schedules[schedule_id]
+            due = datetime.datetime.fromtimestamp(ts, TZ)
+            self._push(schedule, max(due, datetime.datetime.now(TZ)))
+            self._application.create_task(self._fire(schedule, ts, self._stagger(ts)))
+
+    async def _fire(self, schedule, ts, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        metrics.SCHEDULE_LAG.observe(max(0.0, time.time() - ts - delay))
+        try:
+            # A one-shot row is deleted together with the broadcast's creation:
+            # from then on only the outbox delivers it, even across restarts
+            counts = await outbox.submit(
+                self._application.bot, schedule.data, source=f'schedule:{schedule.id}',
+                consume_schedule=schedule.id if schedule.one_shot else None,
+            )
+            logger.info("Schedule %s fired: %s", schedule.id, counts)
+        except Exception:
+            logger.exception("Schedule %s failed", schedule.id)
+
+
+dispatcher = ScheduleDispatcher()
@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the bot at a scratch database before any module reads config
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DB_PATH'] = os.path.join(_tmp.name, 'test.db')
+# No real rate limits to respect against stub bots
+os.environ['BROADCAST_GLOBAL_RATE'] = '10000'
+os.environ['BROADCAST_PER_CHAT_RATE'] = '10000'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """An empty database with freshly loaded in-memory caches."""
+    database.init_db()
+    with database.db.atomic():
+        for table in database.db.get_tables():
+            database.db.execute_sql(f'DELETE FROM "{table}"')
+    database.init_db()
+    return database
@@ -0,0 +1,10 @@
+import asyncio
+
+import database
+
+
+def test_aio_follows_rebound_helpers(db, monkeypatch):
+    assert asyncio.run(database.aio.get_user(1)) is None
+    monkeypatch.setattr(database, 'get_user', lambda user_id: ('patched', user_id))
+    assert asyncio.run(database.aio.get_user(1)) == ('patched', 1)
+
@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+
+import config
+
+DEAD = dict(sent=0, failed=1, latency_ms=None, error='Forbidden: bot was kicked', dead=True)
+PAYLOAD = dict(sent=0, failed=1, latency_ms=None, error='Bad Request: message is too long', dead=False)
+OK = dict(sent=1, failed=0, latency_ms=50.0, error=None, dead=False)
+
+
+@pytest.fixture
+def channel(db, monkeypatch):
+    monkeypatch.setattr(config, 'CHANNEL_QUARANTINE_AFTER', 3)
+    monkeypatch.setattr(config, 'CHANNEL_PROBE_SECONDS', 60)
+    monkeypatch.setattr(config, 'CHANNEL_PROBE_MAX_SECONDS', 200)
+    db.add_channel_safe(-1001, 'c', None, 'https://t.me/x')
+    return '-1001'
+
+
+def row(db, channel_id):
+    return db.Channel.get(db.Channel.channel_id == channel_id)
+
+
+def wait(db, channel_id):
+    # Seconds until the next probe, rounded off the time the test took
+    return round((row(db, channel_id).quarantined_until - datetime.datetime.now()).total_seconds())
+
+
+def test_trips_after_quarantine_threshold(db, channel):
+    assert db.record_deliveries({channel: DEAD}) == []
+    assert db.record_deliveries({channel: DEAD}) == []
+    assert row(db, channel).quarantined_until is None
+
+    tripped = db.record_deliveries({channel: DEAD})
+    assert [c.channel_id for c in tripped] == [channel]
+    assert row(db, channel).consecutive_failures == 3
+    assert wait(db, channel) == 60
+
+
+def test_failed_probes_double_the_wait(db, channel):
+    for _ in range(3):
+        db.record_deliveries({channel: DEAD})
+    # Later failures are failed probes: longer waits, but not reported as a new trip
+    assert db.record_deliveries({channel: DEAD}) == []
+    assert wait(db, channel) == 120
+    db.record_deliveries({channel: DEAD})
+    assert wait(db, channel) == 200  # capped at CHANNEL_PROBE_MAX_SECONDS
+
+
+def test_success_resets_the_breaker(db, channel):
+    for _ in range(4):
+        db.record_deliveries({channel: DEAD})
+    db.record_deliveries({channel: OK})
+    r = row(db, channel)
+    assert (r.consecutive_failures, r.quarantined_until) == (0, None)
+    assert (r.sent_count, r.failed_count, r.avg_latency_ms) == (1, 4, 50.0)
+    # The count starts over
+    db.record_deliveries({channel: DEAD})
+    db.record_deliveries({channel: DEAD})
+    assert row(db, channel).quarantined_until is None
+
+
+def test_payload_errors_do_not_count(db, channel):
+    for _ in range(5):
+        db.record_deliveries({channel: PAYLOAD})
+    r = row(db, channel)
+    assert (r.consecutive_failures, r.quarantined_until, r.failed_count) == (0, None, 5)
+    assert r.last_error == PAYLOAD['error']
@@ -0,0 +1,31 @@
+import pytest
+
+import importer
+
+
+@pytest.mark.parametrize('raw, target, link', [
+    ('-1001234567890', '-1001234567890', None),
+    ('@some_channel', '@some_channel', None),
+    ('https://t.me/some_channel', '@some_channel', 'https://t.me/some_channel'),
+    ('t.me/some_channel', '@some_channel', 'https://t.me/some_channel'),
+    ('https://t.me/some_channel/123', '@some_channel', 'https://t.me/some_channel'),
+    ('https://t.me/s/some_channel', '@some_channel', 'https://t.me/some_channel'),
+    ('https://telegram.me/some_channel?start=x', '@some_channel', 'https://t.me/some_channel'),
+    ('-1001234567890 https://t.me/+AbCdEf', '-1001234567890', 'https://t.me/+AbCdEf'),
+    ('-1001234567890;t.me/joinchat/AbCdEf', '-1001234567890', 'https://t.me/joinchat/AbCdEf'),
+    ('News,@some_channel,1200', '@some_channel', None),
+])
+def test_parse_entry(raw, target, link):
+    entry = importer.parse_entry(1, raw)
+    assert (entry.target, entry.invite_link, entry.outcome) == (target, link, None)
+
+
+def test_private_link_without_id_is_unresolvable():
+    entry = importer.parse_entry(1, 'https://t.me/+AbCdEf')
+    assert entry.outcome == importer.UNRESOLVABLE
+    assert entry.detail == "private invite link needs the channel ID"
+
+
+def test_parse_skips_blanks_and_comments():
+    entries = importer.parse("# channels\n\n@first_one\nchannel,members\n")
+    assert [(e.line_no, e.outcome) for e in entries] == [(3, None), (4, importer.UNRESOLVABLE)]
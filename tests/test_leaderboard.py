@@ -0,0 +1,30 @@
+import pytest
+
+import database
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_credits_update_leaderboards(db, monkeypatch, returning):
+    # False exercises the UPDATE + SELECT path used on SQLite < 3.35
+    monkeypatch.setattr(database, 'HAS_RETURNING', returning)
+    db.add_user(1, 'ref')
+    db.add_user(2, 'b', referrer_id=1)
+    assert db.add_points(2, 5)
+    assert not db.add_points(99, 5)
+    assert db.get_leaderboards() == ([(2, 5, 'b')], [(1, 1, 'ref')])
+    assert db.get_rank(2) == (1, 5)
+
+
+def test_add_user_counts_earlier_referrals_and_reuses_rows(db):
+    db.add_user(2, 'b', referrer_id=1)
+    db.add_user(3, 'c', referrer_id=1)
+    db.User.update(joined_all=True).where(db.User.user_id == 3).execute()
+    user = db.add_user(1, 'a')
+    assert (user.referral_count, user.verified_referral_count) == (2, 1)
+
+    db.mark_users_blocked([1])
+    again = db.add_user(1, 'a', referrer_id=2)
+    assert again.id == user.id and not again.blocked
+    assert not db.get_user(1).blocked
+    # A returning user is never credited to a new referrer
+    assert db.get_user(2).referral_count == 0
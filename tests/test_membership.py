@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+
+from telegram.error import TimedOut
+
+import membership
+
+
+class Member:
+    def __init__(self, status):
+        self.status = status
+
+
+class StubBot:
+    def __init__(self, statuses):
+        self.statuses = statuses  # channel_id -> status
+        self.calls = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append(chat_id)
+        return Member(self.statuses[chat_id])
+
+
+def setup_channels(db, n=2):
+    membership._joined.clear()
+    for i in range(n):
+        db.add_channel_safe(-1000 - i, f'c{i}', None, 'https://t.me/x')
+    return list(db.get_channels())
+
+
+def statuses(db, user_id):
+    return db.get_member_statuses(user_id, [c.channel_id for c in db.get_channels()])
+
+
+def test_positive_index_rows_skip_the_api(db):
+    channels = setup_channels(db)
+    now = datetime.datetime.now()
+    db.record_members([('-1000', 7, 'member', now), ('-1001', 7, 'administrator', now)])
+    bot = StubBot({})
+    assert asyncio.run(membership.find_missing(bot, channels, 7, fail_fast=False)) == ([], [])
+    assert bot.calls == []
+
+
+def test_negative_rows_are_rechecked_and_not_indexed(db):
+    channels = setup_channels(db)
+    db.record_members([('-1000', 7, 'left', datetime.datetime.now())])
+    bot = StubBot({'-1000': 'member', '-1001': 'left'})
+
+    missing, unchecked = asyncio.run(membership.find_missing(bot, channels, 7, fail_fast=False))
+    # The stale 'left' row didn't lock the user out; the new 'left' answer isn't stored
+    assert [c.channel_id for c in missing] == ['-1001']
+    assert sorted(bot.calls) == ['-1000', '-1001']
+    assert statuses(db, 7) == {'-1000': 'member'}
+
+
+def test_older_observation_does_not_overwrite_newer(db):
+    setup_channels(db)
+    now = datetime.datetime.now()
+    db.record_members([('-1000', 7, 'member', now)])
+    # e.g. an API answer asked for before the chat_member update arrived
+    db.record_members([('-1000', 7, 'left', now - datetime.timedelta(seconds=5))])
+    assert statuses(db, 7) == {'-1000': 'member'}
+    db.record_members([('-1000', 7, 'left', now + datetime.timedelta(seconds=5))])
+    assert statuses(db, 7) == {'-1000': 'left'}
+
+
+def test_concurrent_checks_share_one_flight(db):
+    channels = setup_channels(db)
+
+    class SlowBot(StubBot):
+        async def get_chat_member(self, chat_id, user_id):
+            await asyncio.sleep(0.02)
+            return await super().get_chat_member(chat_id, user_id)
+
+    bot = SlowBot({'-1000': 'left', '-1001': 'left'})
+
+    async def run():
+        return await asyncio.gather(*(membership.find_missing(bot, channels, 8, fail_fast=False) for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert all(len(missing) == 2 for missing, unchecked in results)
+    assert len(bot.calls) == 2
+
+
+def test_failed_checks_are_unchecked_not_missing(db):
+    channels = setup_channels(db)
+
+    class BusyBot(StubBot):
+        async def get_chat_member(self, chat_id, user_id):
+            if chat_id == '-1001':
+                # e.g. every interactive connection busy past the pool timeout
+                raise TimedOut("Pool timeout")
+            return await super().get_chat_member(chat_id, user_id)
+
+    bot = BusyBot({'-1000': 'left'})
+    missing, unchecked = asyncio.run(membership.find_missing(bot, channels, 9, fail_fast=False))
+    assert [c.channel_id for c in missing] == ['-1000']
+    assert [c.channel_id for c in unchecked] == ['-1001']
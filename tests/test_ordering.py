@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from benchmarks.fake_bot_api import TOKEN, FakeBotAPI, FakeRequest
+from ordering import OrderedApplication
+
+
+def update(user_id, n):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None, n=n)
+
+
+async def build(concurrent, callback):
+    request = FakeRequest(FakeBotAPI())
+    app = (ApplicationBuilder().token(TOKEN).request(request).get_updates_request(request)
+           .application_class(OrderedApplication).concurrent_updates(concurrent).job_queue(None).build())
+    app.add_handler(TypeHandler(SimpleNamespace, callback))
+    await app.initialize()
+    return app
+
+
+def test_same_user_in_order_other_users_in_parallel():
+    events = []
+    release = {}
+
+    async def handle(upd, context):
+        events.append(('start', upd.n))
+        await release[upd.n].wait()
+        events.append(('end', upd.n))
+
+    async def main():
+        app = await build(8, handle)
+        updates = [update(1, 'a1'), update(2, 'b1'), update(1, 'a2'), update(1, 'a3'), update(2, 'b2')]
+        for u in updates:
+            release[u.n] = asyncio.Event()
+        tasks = [asyncio.create_task(app.process_update(u)) for u in updates]
+        await asyncio.sleep(0)
+        # One update per user in flight, the rest parked behind it
+        assert events == [('start', 'a1'), ('start', 'b1')]
+        assert app.waiting_updates() == 3
+
+        for n in ('b1', 'a1', 'b2', 'a2', 'a3'):
+            release[n].set()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+        assert app.waiting_updates() == 0
+
+    asyncio.run(main())
+    order = [n for kind, n in events if kind == 'start']
+    assert [n for n in order if n[0] == 'a'] == ['a1', 'a2', 'a3']
+    assert [n for n in order if n[0] == 'b'] == ['b1', 'b2']
+    # b2 ran while user 1 was still busy
+    assert events.index(('start', 'b2')) < events.index(('end', 'a2'))
+
+
+def test_pending_updates_counts_semaphore_waiters():
+    async def main():
+        gate = asyncio.Event()
+
+        async def handle(upd, context):
+            await gate.wait()
+
+        app = await build(2, handle)
+
+        async def run(u):
+            # What PTB's update fetcher does for every update
+            async with app._concurrent_updates_sem:
+                await app.process_update(u)
+
+        tasks = [asyncio.create_task(run(update(i, i))) for i in range(5)]
+        await asyncio.sleep(0)
+        assert app.pending_updates() == 3
+        gate.set()
+        await asyncio.gather(*tasks)
+        assert app.pending_updates() == 0
+
+    asyncio.run(main())
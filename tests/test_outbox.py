@@ -0,0 +1,50 @@
+import asyncio
+
+import database
+import outbox
+
+
+class StubBot:
+    def __init__(self):
+        self.sent = []
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.sent.append(chat_id)
+
+
+def test_failed_sent_mark_does_not_abort_batch(db, monkeypatch):
+    for i in range(3):
+        db.add_channel_safe(-1000 - i, f'c{i}', None, 'https://t.me/x')
+
+    real_mark = database.mark_outbox_sent
+    calls = []
+    def flaky(*item_ids):
+        calls.append(item_ids)
+        if len(calls) == 1:
+            raise database.OperationalError('database is locked')
+        return real_mark(*item_ids)
+    monkeypatch.setattr(database, 'mark_outbox_sent', flaky)
+
+    bot = StubBot()
+    counts = asyncio.run(outbox.submit(bot, {'type': 'copy', 'from_chat_id': 1, 'message_id': 2}))
+    assert counts == {'sent': 3}
+    assert sorted(bot.sent) == ['-1000', '-1001', '-1002']
+    # The first mark raised and its item was marked again after the fan-out
+    assert len(calls) == 4
+    assert calls[-1] == calls[0]
+
+
+def test_resume_skips_delivered_channels(db):
+    for i in range(3):
+        db.add_channel_safe(-1000 - i, f'c{i}', None, 'https://t.me/x')
+    data = {'type': 'copy', 'from_chat_id': 1, 'message_id': 2}
+    broadcast_id = db.create_broadcast(data, ['-1000', '-1001', '-1002'], 'live')
+    # One delivered and one in flight when the process died
+    items = {i.channel_id: i.id for i in db.OutboxItem.select()}
+    db.mark_outbox_sent(items['-1000'])
+    db.OutboxItem.update(status='sending').where(db.OutboxItem.id == items['-1001']).execute()
+
+    bot = StubBot()
+    asyncio.run(outbox.resume(bot))
+    assert sorted(bot.sent) == ['-1001', '-1002']
+    assert db.Broadcast.get_by_id(broadcast_id).finished_at is not None
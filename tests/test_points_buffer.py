@@ -0,0 +1,42 @@
+import pytest
+
+import database
+
+
+def points(user_id):
+    return database.User.get(database.User.user_id == user_id).points
+
+
+def test_flush_applies_merged_credits(db):
+    db.add_user(1, 'a')
+    buffer = db.PointsBuffer()
+    buffer.add(1, 5)
+    buffer.add(1, 7)
+    assert buffer.flush() == 1
+    assert points(1) == 12
+    assert len(buffer) == 0
+
+
+def test_failed_flush_keeps_credits(db, monkeypatch):
+    db.add_user(1, 'a')
+    db.add_user(2, 'b')
+    buffer = db.PointsBuffer()
+    buffer.add(1, 5)
+    buffer.add(2, 3)
+
+    real_add_points = database.add_points
+    def failing(user_id, amount):
+        if user_id == 2:
+            raise database.OperationalError('database is locked')
+        return real_add_points(user_id, amount)
+    monkeypatch.setattr(database, 'add_points', failing)
+
+    with pytest.raises(database.OperationalError):
+        buffer.flush()
+    # The whole batch rolled back and is still pending
+    assert points(1) == 0
+    buffer.add(1, 1)
+
+    monkeypatch.setattr(database, 'add_points', real_add_points)
+    assert buffer.flush() == 2
+    assert (points(1), points(2)) == (6, 3)
@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+
+import pytest
+
+import database
+import outbox
+import scheduler
+from scheduler import TZ, CronSpec
+
+
+def at(*args):
+    return datetime.datetime(*args, tzinfo=TZ)
+
+
+def test_cron_fields():
+    spec = CronSpec('*/15 9-17 * * 1-5')
+    assert spec.minutes == {0, 15, 30, 45}
+    assert spec.hours == set(range(9, 18))
+    assert spec.weekdays == {1, 2, 3, 4, 5}
+    assert CronSpec('0 0 * * 7').weekdays == {0}  # 7 is Sunday too
+    assert CronSpec('5/20 * * * *').minutes == {5, 25, 45}
+
+
+@pytest.mark.parametrize('expr', ['* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *',
+                                  '* * * * 8', '5-1 * * * *', '*/0 * * * *', 'x * * * *'])
+def test_bad_cron_rejected(expr):
+    with pytest.raises(ValueError):
+        CronSpec(expr)
+
+
+def test_next_after():
+    spec = CronSpec('30 9 * * *')
+    assert spec.next_after(at(2030, 1, 1, 9, 0)) == at(2030, 1, 1, 9, 30)
+    # Strictly after: the current minute doesn't count
+    assert spec.next_after(at(2030, 1, 1, 9, 30)) == at(2030, 1, 2, 9, 30)
+    assert CronSpec('0 0 1 1 *').next_after(at(2030, 6, 1)) == at(2031, 1, 1)
+
+
+def test_day_of_month_and_weekday_or_rule():
+    # Both restricted: the 13th OR any Friday (2030-09-06 is a Friday)
+    spec = CronSpec('0 12 13 * 5')
+    assert spec.next_after(at(2030, 9, 1)) == at(2030, 9, 6, 12, 0)
+    assert spec.next_after(at(2030, 9, 6, 12, 0)) == at(2030, 9, 13, 12, 0)
+    # Only one restricted: it alone decides
+    assert CronSpec('0 12 13 * *').next_after(at(2030, 9, 1)) == at(2030, 9, 13, 12, 0)
+    assert CronSpec('0 12 * * 5').next_after(at(2030, 9, 7)) == at(2030, 9, 13, 12, 0)
+
+
+def test_parse_command():
+    assert scheduler.parse_command(['09:30', 'hello', 'world']) == ('09:30', ['hello', 'world'])
+    assert scheduler.parse_command(['cron', '0', '9', '*', '*', '1', 'hi']) == ('cron:0 9 * * 1', ['hi'])
+    future = datetime.datetime.now(TZ) + datetime.timedelta(days=2)
+    day, time = f"{future:%Y-%m-%d}", f"{future:%H:%M}"
+    assert scheduler.parse_command(['once', day, time, 'x']) == (f"once:{day} {time}", ['x'])
+
+
+@pytest.mark.parametrize('args', [[], ['25:00'], ['cron', '0', '0'], ['cron', '0', '0', '31', '2', '*', 'hi'],
+                                  ['once', '2000-01-01', '10:00', 'x'], ['once', '2030-01-01']])
+def test_parse_command_rejects(args):
+    with pytest.raises(ValueError):
+        scheduler.parse_command(args)
+
+
+class StubBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def test_one_shot_is_consumed_with_its_broadcast(db):
+    db.add_channel_safe(-1000, 'c', None, 'https://t.me/x')
+    post = db.add_schedule('once:2000-01-01 10:00', {'type': 'text', 'text': 'hi'})
+    bot = StubBot()
+
+    counts = asyncio.run(outbox.submit(bot, {'type': 'text', 'text': 'hi'}, consume_schedule=post.id))
+    assert counts == {'sent': 1}
+    assert db.get_schedule(post.id) is None
+    # A second firing (e.g. a restart racing the outbox resume) sends nothing
+    assert asyncio.run(outbox.submit(bot, {'type': 'text', 'text': 'hi'}, consume_schedule=post.id)) == {}
+    assert bot.sent == ['-1000']
+    assert database.Broadcast.select().count() == 1
@@ -0,0 +1,26 @@
+import throttle
+from cache import TTLCache
+
+
+def test_full_cache_evicts_least_recently_set():
+    cache = TTLCache(60, max_size=11)
+    for i in range(10):
+        cache.set(i, i)
+    cache.set(0, 'active')  # refreshed: now the newest entry
+    cache.set(10, 10)
+    cache.set(11, 11)  # full: evicts one entry
+    assert len(cache) == 11
+    assert cache.get(0) == 'active'
+    assert 1 not in cache
+
+
+def test_bucket_limits_and_survives_eviction_pressure(monkeypatch):
+    monkeypatch.setitem(throttle.RULES, 'verify', (1, 2))  # 1/min, burst 2
+    monkeypatch.setattr(throttle, '_buckets', TTLCache(3600, max_size=10))
+    assert throttle.allow(1, 'verify')
+    assert throttle.allow(1, 'verify')
+    for user_id in range(100, 120):
+        # Other users churn through the store while user 1 keeps tapping
+        throttle.allow(user_id, 'verify')
+        throttle.allow(user_id + 100, 'verify')
+        assert not throttle.allow(1, 'verify')
@@ -0,0 +1,65 @@
+import asyncio
+
+import web
+
+
+async def _ok(request):
+    return web.Response(request.body or b'ok')
+
+
+async def _exchange(raw, idle_timeout=5):
+    server = web.WebServer(idle_timeout=idle_timeout)
+    server.route('POST', '/echo', _ok)
+    server.route('GET', '/health', _ok)
+    await server.start('127.0.0.1', 0)
+    port = server._server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return data
+    finally:
+        await server.stop()
+
+
+def test_keep_alive_serves_pipelined_requests():
+    data = asyncio.run(_exchange(
+        b'POST /echo HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello'
+        b'GET /health?x=1 HTTP/1.1\r\nConnection: close\r\n\r\n'
+    ))
+    assert data.count(b'HTTP/1.1 200 OK') == 2
+    assert data.endswith(b'ok')
+    assert b'hello' in data
+
+
+def test_unknown_path_and_method():
+    data = asyncio.run(_exchange(
+        b'GET /nope HTTP/1.1\r\n\r\n'
+        b'GET /echo HTTP/1.1\r\nConnection: close\r\n\r\n'
+    ))
+    assert b'404 Not Found' in data
+    assert b'405 Method Not Allowed' in data
+
+
+def test_oversized_body_closes_connection():
+    # The unread body must not be parsed as a second request
+    body = b'GET /health HTTP/1.1\r\n\r\n'
+    data = asyncio.run(_exchange(
+        f'POST /echo HTTP/1.1\r\nContent-Length: {web.MAX_BODY + 1}\r\n\r\n'.encode() + body
+    ))
+    assert data.startswith(b'HTTP/1.1 413 Payload Too Large')
+    assert b'Connection: close' in data
+    assert data.count(b'HTTP/1.1') == 1
+
+
+def test_malformed_request_line():
+    data = asyncio.run(_exchange(b'garbage\r\n\r\n'))
+    assert data.startswith(b'HTTP/1.1 400 Bad Request')
+
+
+def test_stalled_client_is_dropped():
+    # Headers never finish: the server gives up after idle_timeout
+    data = asyncio.run(_exchange(b'POST /echo HTTP/1.1\r\nContent-Length: 10\r\n', idle_timeout=0.2))
+    assert data == b''
@@ -0,0 +1,70 @@
+"""
+Per-user rate limits, applied at dispatch before any other handler.
+
+check() runs in handler group -1. Each user gets one token bucket per action
+(THROTTLE_<ACTION>_PER_MINUTE tokens a minute, bursts of THROTTLE_<ACTION>_BURST).
+An update whose bucket is empty stops right there (ApplicationHandlerStop):
+callbacks get a "please wait" toast, /start is dropped silently, and neither
+reaches the DB or the Bot API membership checks. Owners are never throttled.
+"""
+from telegram.ext import ApplicationHandlerStop
+
+import config
+import metrics
+from auth import OWNER
+from cache import TTLCache
+from ratelimit import TokenBucket
+
+WAIT_TEXT = "⏳ Please wait a moment before trying again."
+
+# action: (tokens per minute, burst); a rate of 0 turns the limit off
+RULES = {
+    'start': (config.THROTTLE_START_PER_MINUTE, config.THROTTLE_START_BURST),
+    'verify': (config.THROTTLE_VERIFY_PER_MINUTE, config.THROTTLE_VERIFY_BURST),
+    'callback': (config.THROTTLE_CALLBACK_PER_MINUTE, config.THROTTLE_CALLBACK_BURST),
+}
+
+# Callbacks that run membership checks against every channel
+VERIFY_CALLBACKS = ('verify_join', 'start_earning')
+
+
+def _refill_seconds():
+    # An idle bucket is full again after this long, so it can be forgotten
+    return max((burst / (rate / 60) for rate, burst in RULES.values() if rate > 0), default=60)
+
+
+_buckets = TTLCache(_refill_seconds())
+
+
+def action_for(update):
+    if update.callback_query:
+        return 'verify' if update.callback_query.data in VERIFY_CALLBACKS else 'callback'
+    message = update.message
+    if message and message.text and message.text.split(maxsplit=1)[0].split('@')[0] == '/start':
+        return 'start'
+    return None
+
+
+def allow(user_id, action):
+    rate, burst = RULES[action]
+    if rate <= 0:
+        return True
+    key = (action, user_id)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = TokenBucket(rate / 60, burst)
+    # Re-set on every use: keeps the entry alive and at the recent end of the
+    # store, so busy users are the last to be evicted when it fills up
+    _buckets.set(key, bucket)
+    return bucket.try_acquire()
+
+
+async def check(update, context):
+    user = update.effective_user
+    action = action_for(update)
+    if action is None or user is None or OWNER.check_update(update) or allow(user.id, action):
+        return
+    metrics.THROTTLED.inc(action)
+    if update.callback_query:
+        await update.callback_query.answer(WAIT_TEXT)
+    raise ApplicationHandlerStop
@@ -0,0 +1,46 @@
+"""
+Post recorded update JSON to a running webhook endpoint, the way Telegram does.
+
+    python tools/post_update.py http://localhost:8080/webhook tools/updates/start.json --secret $WEBHOOK_SECRET
+"""
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+
+
+def post(url, update, secret=None):
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode(), method='POST',
+        headers={'Content-Type': 'application/json'}
+    )
+    if secret:
+        request.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('files', nargs='+', help='update JSON files (one update or a list each)')
+    parser.add_argument('--secret', help='value for X-Telegram-Bot-Api-Secret-Token')
+    args = parser.parse_args()
+
+    ok = True
+    for path in args.files:
+        with open(path) as f:
+            data = json.load(f)
+        for update in data if isinstance(data, list) else [data]:
+            status = post(args.url, update, args.secret)
+            print(f"{path} update {update.get('update_id')}: HTTP {status}")
+            ok &= status == 200
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Replay a recorded update log (see RECORD_UPDATES_PATH) through the bot's handlers.
+
+Updates go through the real Application and handlers against a copy of the
+database, while every Bot API call is answered in-process by the fake API in
+benchmarks/fake_bot_api.py. Nothing reaches Telegram or the live DB.
+
+    python tools/replay.py updates.jsonl.gz --db bot.db                   # as fast as possible
+    python tools/replay.py updates.jsonl.gz --db bot.db --speed 1         # original timing
+    python tools/replay.py updates.jsonl.gz --db bot.db --profile-dir prof --top 20
+
+With --profile-dir, each handler gets its own cProfile dump (<handler>.prof,
+open with pstats or snakeviz). Profiling processes updates one at a time
+(CONCURRENT_UPDATES=0) because only one profiler can be active, so a
+handler's profile covers its own work plus whatever background tasks
+(broadcast fan-out, album timers) ran while it was awaiting.
+
+The per-user throttle is off unless --speed is 1: replaying faster than
+real time would otherwise drop updates the live bot let through.
+"""
+import argparse
+import asyncio
+import cProfile
+import functools
+import os
+import pstats
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+def copy_db(src, dst):
+    # The backup API copies a consistent snapshot, WAL included
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+class HandlerStats:
+    def __init__(self, profile):
+        self.calls = 0
+        self.seconds = 0.0
+        self.profile = cProfile.Profile() if profile else None
+
+
+def wrap_handlers(application, profile):
+    """Count, time and optionally profile every handler callback, keyed by name."""
+    stats = {}
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            callback = handler.callback
+            name = f"{callback.__module__}.{callback.__name__}"
+            entry = stats.setdefault(name, HandlerStats(profile))
+
+            @functools.wraps(callback)
+            async def wrapped(update, context, callback=callback, entry=entry):
+                entry.calls += 1
+                start = time.perf_counter()
+                if entry.profile:
+                    entry.profile.enable()
+                try:
+                    return await callback(update, context)
+                finally:
+                    if entry.profile:
+                        entry.profile.disable()
+                    entry.seconds += time.perf_counter() - start
+
+            handler.callback = wrapped
+    return stats
+
+
+async def replay(args):
+    # Imported here so DB_PATH and the other env overrides from main() apply
+    from telegram import Update
+
+    import bot
+    import database
+    import recorder
+    from fake_bot_api import FakeBotAPI, FakeRequest, TOKEN
+
+    database.init_db()
+    for username in args.owner:
+        database.add_owner_safe(username)
+
+    api = FakeBotAPI(member_status=args.member_status, latency=args.latency)
+    application = bot.build_application(TOKEN, request=FakeRequest(api))
+    stats = wrap_handlers(application, profile=bool(args.profile_dir))
+
+    count = 0
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        first = None
+        for entry in recorder.read(args.log):
+            if args.speed > 0:
+                first = entry['t'] if first is None else first
+                delay = (entry['t'] - first) / args.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await application.update_queue.put(Update.de_json(entry['update'], application.bot))
+            count += 1
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+    await database.aio.flush_points()
+
+    print(f"Replayed {count} updates in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f}/s)")
+    print(f"Bot API calls: {dict(api.calls)}")
+    print(f"{'handler':50} {'calls':>7} {'total s':>9} {'mean ms':>9}")
+    for name, entry in sorted(stats.items(), key=lambda kv: -kv[1].seconds):
+        if entry.calls:
+            print(f"{name:50} {entry.calls:7d} {entry.seconds:9.3f} {entry.seconds / entry.calls * 1000:9.2f}")
+
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+        for name, entry in stats.items():
+            if not entry.calls:
+                continue
+            path = os.path.join(args.profile_dir, f"{name}.prof")
+            entry.profile.dump_stats(path)
+            if args.top:
+                print(f"\n=== {name} ({entry.calls} calls) -> {path}")
+                pstats.Stats(entry.profile).sort_stats('cumulative').print_stats(args.top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', help='gzip JSONL written by RECORD_UPDATES_PATH')
+    parser.add_argument('--db', help='database to replay against (copied, never modified)')
+    parser.add_argument('--owner', action='append', default=[], help='extra owner username (repeatable)')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='0 = as fast as possible, 1 = original timing, 10 = ten times faster')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each fake API call')
+    parser.add_argument('--member-status', default='member', help='getChatMember status for users')
+    parser.add_argument('--profile-dir', help='write one cProfile dump per handler here')
+    parser.add_argument('--top', type=int, default=0, help='print the top N functions of each profile')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DB_PATH'] = os.path.join(tmp.name, 'replay.db')
+    if args.db:
+        copy_db(args.db, os.environ['DB_PATH'])
+    os.environ.pop('RECORD_UPDATES_PATH', None)
+    if args.profile_dir:
+        os.environ['CONCURRENT_UPDATES'] = '0'
+    if args.speed <= 0:
+        # No flood limits on the fake API; don't let broadcast pacing dominate
+        os.environ.setdefault('BROADCAST_GLOBAL_RATE', '10000')
+        os.environ.setdefault('BROADCAST_PER_CHAT_RATE', '10000')
+        os.environ.setdefault('ALBUM_WAIT_SECONDS', '0.05')
+    if args.speed != 1:
+        # Compressed time would trip the per-user limits and drop updates the
+        # original run handled; only real-time replays keep them
+        for action in ('START', 'VERIFY', 'CALLBACK'):
+            os.environ.setdefault(f'THROTTLE_{action}_PER_MINUTE', '0')
+    asyncio.run(replay(args))
+
+
+if __name__ == '__main__':
+    main()
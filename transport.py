@@ -0,0 +1,99 @@
+"""
+Separate Bot API connection pools for polling, interactive and bulk traffic.
+
+    poll         getUpdates only (one long-poll connection)
+    interactive  replies to users: /start, callbacks, membership checks
+    bulk         broadcast fan-out, via bulk_bot; wide and optionally HTTP/2
+
+Each pool bounds its in-flight requests itself, so the time a request waits
+for a free connection is measured (bot_http_pool_wait_seconds) and a full
+pool fails after that pool's own pool timeout. A big broadcast can use up
+the bulk pool without making /start replies wait.
+"""
+import asyncio
+import importlib.util
+import logging
+import time
+
+from telegram import Bot
+from telegram._utils.defaultvalue import DefaultValue
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Sends broadcasts over the bulk pool; set by bot.build_application(), None = use the app's bot
+bulk_bot = None
+
+
+class PooledRequest(HTTPXRequest):
+    def __init__(self, name, connection_pool_size, http2=False, **timeouts):
+        self.name = name
+        self.size = connection_pool_size
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        if http2 and not self.http2:
+            logger.warning("HTTP/2 for the %s pool needs the h2 package; using HTTP/1.1", name)
+        self._slots = asyncio.Semaphore(connection_pool_size)
+        super().__init__(connection_pool_size=connection_pool_size, **timeouts)
+
+    def _build_client(self):
+        if self.http2:
+            self._client_kwargs['http2'] = True
+        return super()._build_client()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        if isinstance(pool_timeout, DefaultValue):
+            pool_timeout = self._client.timeout.pool
+        waited = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), pool_timeout)
+        except asyncio.TimeoutError:
+            metrics.HTTP_POOL_TIMEOUTS.inc(self.name)
+            raise TimedOut(f"Pool timeout: all {self.size} connections of the {self.name} pool are busy")
+        metrics.HTTP_POOL_WAIT.observe(time.perf_counter() - waited, self.name)
+
+        metrics.HTTP_IN_FLIGHT.inc(self.name)
+        start = time.perf_counter()
+        try:
+            return await super().do_request(
+                url, method, request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+                connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+            )
+        finally:
+            metrics.HTTP_SECONDS.observe(time.perf_counter() - start, self.name)
+            metrics.HTTP_IN_FLIGHT.dec(self.name)
+            self._slots.release()
+
+
+def poll_request():
+    # read_timeout is added on top of the long-poll timeout by get_updates
+    return PooledRequest(
+        'poll', 1, read_timeout=config.HTTP_POLL_TIMEOUT, write_timeout=config.HTTP_POLL_TIMEOUT,
+        connect_timeout=config.HTTP_POLL_TIMEOUT, pool_timeout=config.HTTP_POLL_TIMEOUT,
+    )
+
+
+def interactive_request():
+    return PooledRequest(
+        'interactive', config.HTTP_INTERACTIVE_POOL_SIZE,
+        read_timeout=config.HTTP_INTERACTIVE_TIMEOUT, write_timeout=config.HTTP_INTERACTIVE_TIMEOUT,
+        connect_timeout=config.HTTP_INTERACTIVE_TIMEOUT, pool_timeout=config.HTTP_INTERACTIVE_POOL_TIMEOUT,
+    )
+
+
+def bulk_request():
+    return PooledRequest(
+        'bulk', config.HTTP_BULK_POOL_SIZE, http2=config.HTTP_BULK_HTTP2,
+        read_timeout=config.HTTP_BULK_TIMEOUT, write_timeout=config.HTTP_BULK_TIMEOUT,
+        connect_timeout=config.HTTP_BULK_TIMEOUT, pool_timeout=config.HTTP_BULK_POOL_TIMEOUT,
+    )
+
+
+def make_bulk_bot(token):
+    kwargs = {'base_url': config.BOT_API_BASE_URL} if config.BOT_API_BASE_URL else {}
+    return Bot(token, request=bulk_request(), **kwargs)
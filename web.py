@@ -0,0 +1,141 @@
+import asyncio
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1024 * 1024  # Telegram updates are far smaller than this
+IDLE_TIMEOUT = 75  # seconds a connection may sit idle, or take to send one request
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class Request:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers  # lower-cased names
+        self.body = body
+
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='text/plain; charset=utf-8'):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+
+
+class WebServer:
+    """
+    Minimal HTTP/1.1 server on the bot's own event loop. It only needs to serve
+    Telegram's webhook POSTs and a few small GET endpoints, so it speaks just
+    enough HTTP for that: Content-Length bodies and keep-alive.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._routes = {}
+        self._server = None
+
+    def route(self, method, path, handler):
+        # handler: async (Request) -> Response
+        self._routes[(method, path)] = handler
+
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info("HTTP server listening on %s:%s", host, port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY:
+            return Request(method, target, headers, None)
+        body = await reader.readexactly(length) if length else b''
+        return Request(method, target.split('?', 1)[0], headers, body)
+
+    async def _dispatch(self, request):
+        if request.body is None:
+            return Response('Too large', 413)
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            known = any(path == request.path for _, path in self._routes)
+            return Response('Method not allowed', 405) if known else Response('Not found', 404)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception("Error handling %s %s", request.method, request.path)
+            return Response('Internal error', 500)
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # Idle keep-alive connection or a stalled client
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    request = None
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                if request is None:
+                    break
+
+                response = await self._dispatch(request)
+                # An oversized body was never read, so the stream can't be reused
+                keep_alive = request.body is not None and request.headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+                    f"Content-Type: {response.content_type}\r\n"
+                    f"Content-Length: {len(response.body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                    + response.body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def health(request):
+    return Response("I am alive")
+
+
+def webhook_handler(application, secret_token):
+    """Route that verifies Telegram's secret header and queues the update."""
+
+    async def handle(request):
+        given = request.headers.get('x-telegram-bot-api-secret-token', '')
+        if not hmac.compare_digest(given.encode(), secret_token.encode()):
+            return Response('Forbidden', 403)
+        try:
+            update = Update.de_json(json.loads(request.body), application.bot)
+        except (ValueError, TypeError, KeyError):
+            return Response('Bad update', 400)
+        # Answer Telegram right away; the Application processes the queue
+        await application.update_queue.put(update)
+        return Response('OK')
+
+    return handle